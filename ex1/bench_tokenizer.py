@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the tokenizer: WORD_RE split versus str.translate + split.
+Checks that both produce identical token sets for every review first.
+Example: python bench_tokenizer.py reviews_devset.json --stopwords stopwords.txt
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from preprocessor import load_stopwords
+from tokenizer import extract_tokens, extract_tokens_regex
+
+
+def load_texts(path, limit):
+    """
+    Load the lowercased review texts of a JSON lines file.
+    """
+    texts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            texts.append(json.loads(line).get("reviewText", "").lower())
+            if len(texts) == limit:
+                break
+    return texts
+
+
+def verify(texts, stopwords):
+    """
+    Return the indices of the texts where both tokenizers disagree.
+    """
+    return [
+        i
+        for i, text in enumerate(texts)
+        if extract_tokens(text, stopwords) != extract_tokens_regex(text, stopwords)
+    ]
+
+
+def measure(tokenize, texts, stopwords, repeat):
+    """
+    Best of repeat runs, as (seconds, number of tokens).
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = 0
+        for text in texts:
+            tokens += len(tokenize(text, stopwords))
+        best = min(best, time.perf_counter() - start)
+    return best, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tokenizer micro-benchmark")
+    parser.add_argument("input", help="JSON lines review file")
+    parser.add_argument("--stopwords", required=True, help="Path to the stopwords file")
+    parser.add_argument("--limit", type=int, default=100_000, help="Number of reviews")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per tokenizer")
+    args = parser.parse_args()
+
+    stopwords = load_stopwords(args.stopwords)
+    texts = load_texts(args.input, args.limit)
+
+    mismatches = verify(texts, stopwords)
+    if mismatches:
+        print(f"Token sets differ for {len(mismatches)} reviews, e.g. #{mismatches[0]}")
+        sys.exit(1)
+    print(f"Token sets identical for {len(texts)} reviews")
+    ascii_share = sum(text.isascii() for text in texts) / max(1, len(texts))
+    print(f"ASCII reviews (translate fast path): {ascii_share:.1%}")
+
+    baseline = None
+    for name, tokenize in (("regex", extract_tokens_regex), ("translate", extract_tokens)):
+        seconds, tokens = measure(tokenize, texts, stopwords, args.repeat)
+        rate = tokens / seconds
+        speedup = f"  {rate / baseline:.2f}x" if baseline else ""
+        baseline = baseline or rate
+        print(f"{name:<10} {seconds:8.3f} s  {rate:12,.0f} tokens/s{speedup}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the tokenize -> count -> chi-square pipeline on synthetic reviews.
+
+For every scale a corpus is generated with synthetic.py (cached in --workdir),
+then PreprocessorJob, ChiSquaredJob and the end-to-end main.py driver are timed
+on the inline or local runner. Results are stored as JSON and can be compared
+with the results of an earlier run: slower timings beyond --threshold and
+changed outputs are reported as regressions.
+Example: python benchmark.py --scales 1000,10000 --output bench.json
+Example: python benchmark.py --scales 1000,10000 --compare bench.json
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from chisquared import ChiSquaredJob
+from preprocessor import PreprocessorJob
+from synthetic import write_reviews
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STOPWORDS = os.path.join(HERE, "stopwords.txt")
+
+
+def corpus(workdir, docs, seed):
+    """
+    Path of the synthetic corpus of a scale, generated on first use.
+    """
+    path = os.path.join(workdir, f"synthetic_{docs}_{seed}.json")
+    if not os.path.exists(path):
+        write_reviews(path, docs, seed=seed)
+    return path
+
+
+def run_job(job_class, args):
+    """
+    Run an MRJob in this process and return its output as a list of (key, value).
+    """
+    job = job_class(args)
+    with job.make_runner() as runner:
+        runner.run()
+        # RawProtocol keeps the line break in the value
+        return [
+            (key, value.rstrip("\n")) for key, value in job.parse_output(runner.cat_output())
+        ]
+
+
+def write_counts(workdir, records):
+    """
+    Split preprocessor output into the side files of chisquared.py like main.py.
+    Returns the paths and N.
+    """
+    paths = {
+        kind: os.path.join(workdir, f"bench_{kind}.out")
+        for kind in ("category", "token", "category_token")
+    }
+    n = 0
+    with open(paths["category"], "w") as c, open(paths["token"], "w") as t, open(
+        paths["category_token"], "w"
+    ) as tc:
+        for key, value in records:
+            kind, token, category = key.split(".")
+            if kind == "TC":
+                tc.write(f"{key}\t{value}\n")
+            elif kind == "C":
+                c.write(f"{category}\t{value}\n")
+                n += int(value)
+            else:
+                t.write(f"{token}\t{value}\n")
+    return paths, n
+
+
+def digest(lines):
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def timed(function, repeat):
+    """
+    Best wall-clock time of repeat calls and the result of the last one.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_scale(workdir, docs, runner, repeat, seed):
+    """
+    Timings, throughput and output digests of all benchmarks at one scale.
+    """
+    path = corpus(workdir, docs, seed)
+    runner_args = ["-r", runner]
+    results = {}
+
+    seconds, records = timed(
+        lambda: run_job(PreprocessorJob, runner_args + [path, "--stopwords", STOPWORDS]),
+        repeat,
+    )
+    results["preprocessor"] = {
+        "seconds": seconds,
+        "docs_per_second": docs / seconds,
+        "output_records": len(records),
+        "digest": digest(sorted(f"{key}\t{value}" for key, value in records)),
+    }
+
+    paths, n = write_counts(workdir, records)
+    chisquared_args = runner_args + [
+        paths["category_token"],
+        "--category_counts",
+        paths["category"],
+        "--token_counts",
+        paths["token"],
+        "--n",
+        str(n),
+    ]
+    seconds, top = timed(lambda: run_job(ChiSquaredJob, chisquared_args), repeat)
+    results["chisquared"] = {
+        "seconds": seconds,
+        "records_per_second": len(records) / seconds,
+        "digest": digest(sorted(f"{key}\t{value}" for key, value in top)),
+    }
+
+    command = [sys.executable, "main.py", path, "--stopwords", STOPWORDS] + runner_args
+    seconds, output = timed(
+        lambda: subprocess.run(
+            command,
+            cwd=HERE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=True,
+        ).stdout,
+        repeat,
+    )
+    results["end_to_end"] = {
+        "seconds": seconds,
+        "docs_per_second": docs / seconds,
+        "digest": digest(output.splitlines()),
+    }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the speedup of every benchmark against a baseline.
+    Returns the number of regressions (slower than threshold or a changed output).
+    """
+    regressions = 0
+    if baseline["runner"] != results["runner"]:
+        print(f"Baseline ran on the {baseline['runner']} runner, not {results['runner']}")
+    print(f"{'scale':>10} {'benchmark':<14} {'baseline':>10} {'current':>10} {'speedup':>8}")
+    for scale, benchmarks in results["scales"].items():
+        for name, current in benchmarks.items():
+            base = baseline["scales"].get(scale, {}).get(name)
+            if base is None:
+                continue
+            speedup = base["seconds"] / current["seconds"]
+            notes = []
+            if speedup < 1 / (1 + threshold):
+                notes.append("SLOWER")
+            if base["digest"] != current["digest"]:
+                notes.append("OUTPUT CHANGED")
+            regressions += bool(notes)
+            print(
+                f"{scale:>10} {name:<14} {base['seconds']:>9.2f}s {current['seconds']:>9.2f}s "
+                f"{speedup:>7.2f}x {' '.join(notes)}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline benchmark on synthetic reviews")
+    parser.add_argument(
+        "--scales", default="1000,10000,50000", help="Comma separated numbers of reviews"
+    )
+    parser.add_argument("--runner", choices=["inline", "local"], default="inline")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per benchmark, best counts")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the synthetic corpus")
+    parser.add_argument(
+        "--workdir", default="bench_data", help="Directory of the generated corpora"
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results JSON to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown reported as a regression (default 0.1)",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    results = {
+        "started": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "runner": args.runner,
+        "seed": args.seed,
+        "scales": {},
+    }
+    for scale in args.scales.split(","):
+        docs = int(scale)
+        print(f"Benchmarking {docs} reviews", file=sys.stderr)
+        results["scales"][str(docs)] = bench_scale(
+            args.workdir, docs, args.runner, args.repeat, args.seed
+        )
+        for name, result in results["scales"][str(docs)].items():
+            print(f"{docs:>10} {name:<14} {result['seconds']:>9.2f}s", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
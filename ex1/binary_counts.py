@@ -0,0 +1,221 @@
+"""
+Compact binary format for the counts handed from the preprocessor to chisquared.py.
+
+Layout (native byte order, every section padded to 8 bytes):
+    header          magic, version, N, #categories, #tokens, #records
+    categories      uint32 offsets[#categories + 1] + utf-8 blob
+    tokens          uint32 offsets[#tokens + 1] + utf-8 blob
+    category counts int32[#categories]
+    token counts    int32[#tokens]
+    records         int32[#records * 3] as (token_id, cat_id, count)
+
+chisquared.py reads a counts file in record ranges, write_ranges writes one
+"start<TAB>stop" input file per range so every range gets its own map task.
+"""
+
+from array import array
+import mmap
+import os
+import struct
+
+MAGIC = b"CHI2"
+# Records scored by one chisquared.py map task
+RECORDS_PER_RANGE = 1 << 20
+VERSION = 1
+HEADER = struct.Struct("=4sIqIIQ")
+
+
+def _pad(size):
+    return -size % 8
+
+
+class CountsBuilder:
+    """
+    Collect preprocessor counts with integer ids and save them in the binary format.
+    Counts added more than once for the same key are summed, so a builder
+    loaded from an existing file can be updated with new counts.
+
+    With unique_pairs every token-category pair is added only once (like the
+    reduced preprocessor output), the pairs are appended to the records array
+    as they come instead of being summed in a dict.
+    """
+
+    def __init__(self, unique_pairs=False):
+        self.category_ids = {}
+        self.category_counts = array("i")
+        self.token_ids = {}
+        self.token_counts = array("i")
+        # (token_id, cat_id) -> count, None if the pairs go to records directly
+        self.pair_counts = None if unique_pairs else {}
+        self.records = array("i")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Builder holding all counts of an existing binary counts file.
+        """
+        counts = CountsReader(path)
+        builder = cls()
+        for cat_id, category in enumerate(counts.categories):
+            builder.add_category(category, counts.category_counts[cat_id])
+        for token_id, count in enumerate(counts.token_counts):
+            builder.add_token(counts.token(token_id), count)
+        builder.pair_counts = {
+            (token_id, cat_id): count for token_id, cat_id, count in counts.iter_records()
+        }
+        return builder
+
+    def category_id(self, category):
+        cat_id = self.category_ids.get(category)
+        if cat_id is None:
+            cat_id = self.category_ids[category] = len(self.category_ids)
+            self.category_counts.append(0)
+        return cat_id
+
+    def token_id(self, token):
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            token_id = self.token_ids[token] = len(self.token_ids)
+            self.token_counts.append(0)
+        return token_id
+
+    def add_category(self, category, count):
+        self.category_counts[self.category_id(category)] += count
+
+    def add_token(self, token, count):
+        self.token_counts[self.token_id(token)] += count
+
+    def add_pair(self, token, category, count):
+        key = (self.token_id(token), self.category_id(category))
+        if self.pair_counts is None:
+            self.records.extend((*key, count))
+        else:
+            self.pair_counts[key] = self.pair_counts.get(key, 0) + count
+
+    def add_line(self, key, value):
+        """
+        Add one "C.*.category", "T.token.*" or "TC.token.category" preprocessor record.
+        """
+        kind, token, category = key.split(".")
+        if kind == "TC":
+            self.add_pair(token, category, int(value))
+        elif kind == "C":
+            self.add_category(category, int(value))
+        elif kind == "T":
+            self.add_token(token, int(value))
+
+    @property
+    def n(self):
+        return sum(self.category_counts)
+
+    def save(self, path):
+        """
+        Write the binary counts file, replacing an existing one only once complete.
+        Returns the number of records.
+        """
+        records = self.records
+        if self.pair_counts is not None:
+            records = array("i")
+            for (token_id, cat_id), count in self.pair_counts.items():
+                records.extend((token_id, cat_id, count))
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(
+                HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    self.n,
+                    len(self.category_ids),
+                    len(self.token_ids),
+                    len(records) // 3,
+                )
+            )
+            f.write(b"\0" * _pad(HEADER.size))
+            for strings in (self.category_ids, self.token_ids):
+                offsets = array("I", [0])
+                blob = bytearray()
+                for string in strings:
+                    blob += string.encode("utf-8")
+                    offsets.append(len(blob))
+                f.write(offsets.tobytes())
+                f.write(b"\0" * _pad(len(offsets) * offsets.itemsize))
+                f.write(blob)
+                f.write(b"\0" * _pad(len(blob)))
+            for values in (self.category_counts, self.token_counts, records):
+                f.write(values.tobytes())
+                f.write(b"\0" * _pad(len(values) * values.itemsize))
+        os.replace(tmp_path, path)
+        return len(records) // 3
+
+
+class CountsReader:
+    """
+    Memory mapped view of a binary counts file.
+
+    Count arrays are int32 memoryviews into the mapping, nothing is copied
+    except the category names and the tokens that are looked up.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mmap)
+
+        magic, version, self.n, n_categories, n_tokens, self.n_records = HEADER.unpack_from(
+            view
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a binary counts file")
+        pos = HEADER.size + _pad(HEADER.size)
+
+        strings = []
+        for count in (n_categories, n_tokens):
+            size = (count + 1) * 4
+            offsets = view[pos : pos + size].cast("I")
+            pos += size + _pad(size)
+            blob = view[pos : pos + offsets[-1]]
+            pos += offsets[-1] + _pad(offsets[-1])
+            strings.append((offsets, blob))
+        (self.category_offsets, self.category_blob), (self.token_offsets, self.token_blob) = strings
+
+        arrays = []
+        for count in (n_categories, n_tokens, self.n_records * 3):
+            size = count * 4
+            arrays.append(view[pos : pos + size].cast("i"))
+            pos += size + _pad(size)
+        self.category_counts, self.token_counts, self.records = arrays
+
+        self.categories = [self.category(i) for i in range(n_categories)]
+
+    def category(self, cat_id):
+        offsets = self.category_offsets
+        return str(self.category_blob[offsets[cat_id] : offsets[cat_id + 1]], "utf-8")
+
+    def token(self, token_id):
+        offsets = self.token_offsets
+        return str(self.token_blob[offsets[token_id] : offsets[token_id + 1]], "utf-8")
+
+    def iter_records(self, start=0, stop=None):
+        """
+        Yield the (token_id, cat_id, count) records from start to stop (default all).
+        """
+        records = self.records
+        stop = self.n_records if stop is None else stop
+        for i in range(3 * start, 3 * stop, 3):
+            yield records[i], records[i + 1], records[i + 2]
+
+
+def write_ranges(directory, n_records, records_per_range=RECORDS_PER_RANGE):
+    """
+    Replace the range input files of a counts file with n_records records.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    starts = range(0, max(n_records, 1), records_per_range)
+    for part, start in enumerate(starts):
+        stop = min(start + records_per_range, n_records)
+        with open(os.path.join(directory, f"part-{part:05d}"), "w") as f:
+            f.write(f"{start}\t{stop}\n")
+    return len(starts)
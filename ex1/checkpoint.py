@@ -0,0 +1,172 @@
+"""
+Checkpoint manifest of the main.py pipeline stages.
+
+A completed stage is recorded with the fingerprint of what it was computed
+from (inputs, stopwords and options) and of the outputs it wrote. A retried
+run with --resume skips a stage whose fingerprint is unchanged and whose
+outputs still exist unmodified.
+
+Local paths are fingerprinted by size and mtime, HDFS paths by the HDFS
+checksums of their files, the stopwords additionally by a hash of their content.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+
+
+def is_hdfs(path):
+    return path.startswith("hdfs://")
+
+
+def hdfs_fingerprint(path):
+    """
+    [(file, checksum), ...] of all files below an HDFS path, None if it does not exist.
+    """
+    ls = subprocess.run(
+        ["hdfs", "dfs", "-ls", "-R", path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    if ls.returncode != 0:
+        return None
+    # Listing lines: permissions, replication, owner, group, size, date, time, path
+    files = [
+        line.split(None, 7)[7]
+        for line in ls.stdout.splitlines()
+        if line.startswith("-")
+    ]
+    if not files:
+        return []
+    checksum = subprocess.run(
+        ["hdfs", "dfs", "-checksum", *files],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    return sorted(line.split("\t")[0::2] for line in checksum.stdout.splitlines())
+
+
+def local_fingerprint(path):
+    """
+    [(file, size, mtime), ...] of a local file or all files below a directory,
+    None if it does not exist.
+    """
+    if os.path.isfile(path):
+        files = [path]
+    elif os.path.isdir(path):
+        files = sorted(
+            os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+        )
+    else:
+        return None
+    return [[f, os.path.getsize(f), os.stat(f).st_mtime_ns] for f in files]
+
+
+def path_fingerprint(path):
+    if is_hdfs(path):
+        return hdfs_fingerprint(path)
+    return local_fingerprint(path)
+
+
+def file_hash(path):
+    """
+    SHA-256 of the content of a local file.
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def input_fingerprint(job_args, options):
+    """
+    Fingerprint of a run: its job arguments and driver options, every argument
+    that is an existing local or HDFS path, and the content of the stopwords.
+    """
+    stopwords = None
+    for i, arg in enumerate(job_args):
+        if arg == "--stopwords" and i + 1 < len(job_args):
+            stopwords = job_args[i + 1]
+        elif arg.startswith("--stopwords="):
+            stopwords = arg.split("=", 1)[1]
+
+    paths = {}
+    for arg in job_args:
+        path = arg.split("=", 1)[1] if arg.startswith("--") and "=" in arg else arg
+        if path == stopwords:
+            continue
+        if is_hdfs(path) or (not path.startswith("-") and os.path.exists(path)):
+            paths[path] = path_fingerprint(path)
+
+    return {
+        "job_args": job_args,
+        "options": options,
+        "paths": paths,
+        "stopwords": file_hash(stopwords) if stopwords and os.path.isfile(stopwords) else None,
+    }
+
+
+def local_input_bytes(fingerprint):
+    """
+    Total size of the local files among the paths of a run fingerprint.
+    """
+    return sum(
+        size
+        for files in fingerprint["paths"].values()
+        if files
+        for _, size, _ in (f for f in files if len(f) == 3)
+    )
+
+
+class Manifest:
+    """
+    Completed stages of the pipeline, stored as JSON.
+    """
+
+    def __init__(self, path, stages=None):
+        self.path = path
+        self.stages = stages or {}
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(path, json.load(f).get("stages", {}))
+
+    def completed(self, stage, fingerprint):
+        """
+        The result recorded for a completed stage, None if it has to run again
+        because its inputs changed or its outputs are missing or modified.
+        """
+        record = self.stages.get(stage)
+        if record is None or record["fingerprint"] != fingerprint:
+            return None
+        for path, output_fingerprint in record["outputs"].items():
+            if path_fingerprint(path) != output_fingerprint:
+                return None
+        return record["result"]
+
+    def complete(self, stage, fingerprint, outputs, result):
+        """
+        Record a completed stage with the outputs it wrote and save the manifest.
+        """
+        self.stages[stage] = {
+            "fingerprint": fingerprint,
+            "outputs": {path: path_fingerprint(path) for path in outputs},
+            "result": result,
+        }
+        self.save()
+
+    def save(self):
+        """
+        Write the manifest, replacing the old one only once complete.
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"stages": self.stages}, f, indent=2)
+        os.replace(tmp_path, self.path)
@@ -1,19 +1,84 @@
 #!/usr/bin/env python3
 """
 Example: python chisquared.py preprocessor.out --n int --category_counts path --token_counts path > output.txt
+Example: python chisquared.py counts.bin --binary > output.txt
+Example: python chisquared.py counts.bin.ranges --binary --counts counts.bin > output.txt
+Add --vectorized to score whole category blocks with NumPy.
+Example: python chisquared.py counts_category_token.out counts_token.out --join_token_counts --n int --category_counts path
+Add --metrics chi2:75,mi:50,llr:75 to rank the tokens by several metrics in one pass.
 """
 
 from mrjob.protocol import RawProtocol
 from mrjob.job import MRJob
 from mrjob.step import MRStep
+from functools import cached_property
 import heapq
 
+from binary_counts import CountsReader
+from lookup import CountLookup
+from scoring import METRICS, chi_squared, contingency, parse_metrics
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def load_counts(path):
+    """
+    Load a "key\tcount" side table into a dict.
+    """
+    counts = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f.readlines():
+            key, value = line.split("\t")
+            counts[key] = int(value)
+    return counts
+
+
+def top_k_candidates(N, A, T, n_c, k):
+    """
+    Score all token counts A (with token totals T) of one category block with
+    NumPy and return the indices of the k largest chi-squared values.
+
+    Float64 rounding differs slightly from the exact integer formula, so every
+    value within a relative 1e-9 of the k-th largest one is kept as well. The
+    candidates are rescored exactly before they go into the top-k selection.
+    A zero denominator raises ZeroDivisionError like the exact formula.
+    """
+    A = np.asarray(A, dtype=np.float64)
+    B = np.asarray(T, dtype=np.float64) - A
+    C = n_c - A
+    D = N - A - B - C
+    with np.errstate(divide="ignore", invalid="ignore"):
+        chi2 = chi_squared(float(N), A, B, C, D)
+    # NaN would rank above every score in argpartition and empty the selection
+    if not np.isfinite(chi2).all():
+        raise ZeroDivisionError("chi-squared denominator is zero for some tokens")
+
+    if len(chi2) <= k:
+        return np.arange(len(chi2))
+    top = np.argpartition(chi2, -k)[-k:]
+    return np.flatnonzero(chi2 >= chi2[top].min() * (1 - 1e-9))
+
+
+def format_top_k(term_chi_pairs):
+    """
+    Format (score, token) pairs as "token:score" sorted by descending score.
+    """
+    return " ".join(
+        [f"{token}:{chi2:.4f}" for chi2, token in sorted(term_chi_pairs, reverse=True)]
+    )
+
 
 class ChiSquaredJob(MRJob):
 
     INPUT_PROTOCOL = RawProtocol
     OUTPUT_PROTOCOL = RawProtocol
 
+    # Shipped with the job for the --binary and --token_lookup formats and the metrics
+    FILES = ["binary_counts.py", "lookup.py", "scoring.py"]
+
     def configure_args(self):
         super(ChiSquaredJob, self).configure_args()
         """
@@ -22,49 +87,287 @@ class ChiSquaredJob(MRJob):
         self.add_passthru_arg("--n", type=int, help="Total number of documents")
         self.add_file_arg("--category_counts", help="Path to the category_counts file")
         self.add_file_arg("--token_counts", help="Path to the token_counts file")
+        self.add_file_arg(
+            "--token_lookup",
+            help="Path to a memory mapped token_counts lookup file (see lookup.py), "
+            "used instead of --token_counts",
+        )
+        self.add_passthru_arg(
+            "--binary",
+            action="store_true",
+            help="Input is a binary counts file which already contains N, "
+            "the category counts and the token counts",
+        )
+        self.add_file_arg(
+            "--counts",
+            help="Binary counts file of --binary, the input is then its record "
+            "ranges (see binary_counts.write_ranges), one map task per range file",
+        )
+        self.add_passthru_arg(
+            "--join_token_counts",
+            action="store_true",
+            help="Token counts are part of the input and joined with the TC "
+            "records in the shuffle instead of being loaded by every mapper",
+        )
+        self.add_passthru_arg(
+            "--vectorized",
+            action="store_true",
+            help="Score each category block with NumPy and only emit the top "
+            "candidates of every mapper (chi2 only)",
+        )
+        self.add_passthru_arg(
+            "--metrics",
+            default="chi2",
+            help="Comma separated metrics with optional top k, e.g. chi2:75,mi:50,llr. "
+            f"Available: {', '.join(METRICS)}. With more than one metric the output "
+            "keys are metric.category",
+        )
+
+    def steps(self):
+        """
+        Binary counts files are read as a whole by mapper_binary, or in record
+        ranges by mapper_binary_range with --counts.
+        With --vectorized the mappers score complete category blocks.
+        With --join_token_counts a first step joins T and TC records by token.
+        """
+        if self.options.vectorized and np is None:
+            raise ImportError("--vectorized requires numpy")
+        if self.options.vectorized and [name for name, _ in self.metrics] != ["chi2"]:
+            raise ValueError("--vectorized only supports --metrics chi2")
+
+        if self.options.join_token_counts:
+            return [
+                MRStep(
+                    mapper=self.mapper_join,
+                    reducer_init=self.reducer_init_join,
+                    reducer=self.reducer_join,
+                ),
+                MRStep(combiner=self.combiner, reducer=self.reducer),
+            ]
+
+        if self.options.binary and self.options.counts:
+            return [
+                MRStep(
+                    mapper_init=self.mapper_init_binary,
+                    mapper=self.mapper_binary_range,
+                    combiner=self.combiner,
+                    reducer=self.reducer,
+                )
+            ]
+        if self.options.binary:
+            return [
+                MRStep(mapper_raw=self.mapper_binary, combiner=self.combiner, reducer=self.reducer)
+            ]
+        if self.options.vectorized:
+            return [
+                MRStep(
+                    mapper_init=self.mapper_init,
+                    mapper=self.mapper_collect,
+                    mapper_final=self.mapper_final_vectorized,
+                    combiner=self.combiner,
+                    reducer=self.reducer,
+                )
+            ]
+        return [
+            MRStep(
+                mapper_init=self.mapper_init,
+                mapper=self.mapper,
+                combiner=self.combiner,
+                reducer=self.reducer,
+            )
+        ]
+
+    @cached_property
+    def metrics(self):
+        """
+        The (name, k) pairs of the --metrics option.
+        """
+        return parse_metrics(self.options.metrics)
+
+    def metric_key(self, name, category):
+        """
+        Output key of a metric, plain category unless several metrics are computed.
+        """
+        if len(self.metrics) == 1:
+            return category
+        return f"{name}.{category}"
+
+    def top_k(self, key):
+        """
+        Number of tokens kept for an output key.
+        """
+        if len(self.metrics) == 1:
+            return self.metrics[0][1]
+        name, _ = key.split(".", 1)
+        return dict(self.metrics)[name]
+
+    def scores(self, category, token, N, A, B, C, D):
+        """
+        Emit the (score, token) pair of every metric for one contingency table.
+        """
+        for name, _ in self.metrics:
+            score = METRICS[name](N, A, B, C, D)
+            yield self.metric_key(name, category), (score, token)
+
+    def sort_values(self):
+        """
+        The join reducer relies on the T record arriving before the TC records.
+        """
+        return self.options.join_token_counts
 
     def mapper_init(self):
         """
         Initialization to access data from preprocessor.
         """
         self.N = self.options.n
+        self.blocks = {}
 
-        self.map_C = {}
-        with open(self.options.category_counts, "r", encoding="utf-8") as f:
-            for line in f.readlines():
-                key, value = line.split("\t")
-                self.map_C[key] = int(value)
+        self.map_C = load_counts(self.options.category_counts)
 
-        self.map_T = {}
-        with open(self.options.token_counts, "r", encoding="utf-8") as f:
-            for line in f.readlines():
-                key, value = line.split("\t")
-                self.map_T[key] = int(value)
+        if self.options.token_lookup:
+            self.map_T = CountLookup(self.options.token_lookup)
+            return
+
+        self.map_T = load_counts(self.options.token_counts)
 
     def mapper(self, key, value):
         """
         Compute chi-squared values.
         """
         id, token, category = key.split(".")
-        A = int(value)
-        B = self.map_T[token] - A
-        C = self.map_C[category] - A
-        D = self.N - A - B - C
+        A, B, C, D = contingency(self.N, self.map_T[token], self.map_C[category], int(value))
+        yield from self.scores(category, token, self.N, A, B, C, D)
 
-        numerator = self.N * (A * D - B * C) ** 2
-        denominator = (A + B) * (A + C) * (B + D) * (C + D)
+    def mapper_join(self, key, value):
+        """
+        Key T and TC records by token.
+        Values are sorted, so ["T", count] comes before all ["TC", category, count].
+        Accepts token counts as "token" or as raw preprocessor "T.token.*" keys,
+        raw "C.*.category" keys are skipped.
+        """
+        if "." not in key:
+            yield key, ["T", int(value)]
+            return
 
-        chi2 = numerator / denominator
-        yield category, (chi2, token)
+        id, token, category = key.split(".")
+        if id == "TC":
+            yield token, ["TC", category, int(value)]
+        elif id == "T":
+            yield token, ["T", int(value)]
 
-    def reducer(self, category, term_chi_pairs):
+    def reducer_init_join(self):
         """
-        Keep top 75 tokens per category.
+        Load the category counts for the join reducer.
         """
-        top_75 = heapq.nlargest(75, term_chi_pairs)
-        yield category, " ".join(
-            [f"{token}:{chi2:.4f}" for chi2, token in sorted(top_75, reverse=True)]
-        )
+        self.N = self.options.n
+        self.map_C = load_counts(self.options.category_counts)
+
+    def reducer_join(self, token, values):
+        """
+        Compute chi-squared values of a token from its total and TC records.
+        """
+        kind, T = next(values)
+        if kind != "T":
+            raise ValueError(f"Missing token count for {token}")
+
+        for _, category, A in values:
+            A, B, C, D = contingency(self.N, T, self.map_C[category], A)
+            yield from self.scores(category, token, self.N, A, B, C, D)
+
+    def mapper_collect(self, key, value):
+        """
+        Collect the token counts of every category for mapper_final_vectorized.
+        """
+        id, token, category = key.split(".")
+        block = self.blocks.setdefault(category, ([], [], []))
+        block[0].append(token)
+        block[1].append(int(value))
+        block[2].append(self.map_T[token])
+
+    def mapper_final_vectorized(self):
+        """
+        Score the collected category blocks and emit the top candidates.
+        """
+        N = self.N
+        (_, k), = self.metrics
+        for category, (tokens, counts, token_counts) in self.blocks.items():
+            n_c = self.map_C[category]
+            for i in top_k_candidates(N, counts, token_counts, n_c, k):
+                A, B, C, D = contingency(N, token_counts[i], n_c, counts[i])
+                yield category, (chi_squared(N, A, B, C, D), tokens[i])
+
+    def score_records(self, counts, start, stop):
+        """
+        Compute chi-squared values for a range of records of a binary counts file.
+        """
+        N = counts.n
+        categories = counts.categories
+        category_counts = counts.category_counts
+        token_counts = counts.token_counts
+
+        for token_id, cat_id, A in counts.iter_records(start, stop):
+            A, B, C, D = contingency(N, token_counts[token_id], category_counts[cat_id], A)
+            token = counts.token(token_id)
+            yield from self.scores(categories[cat_id], token, N, A, B, C, D)
+
+    def score_records_vectorized(self, counts, start, stop):
+        """
+        Score a range of records of a binary counts file category by category with NumPy.
+        """
+        N = counts.n
+        records = np.frombuffer(counts.records, dtype=np.int32).reshape(-1, 3)[start:stop]
+        token_counts = np.frombuffer(counts.token_counts, dtype=np.int32)
+        (_, k), = self.metrics
+
+        for cat_id, category in enumerate(counts.categories):
+            block = records[records[:, 1] == cat_id]
+            token_ids = block[:, 0]
+            T = token_counts[token_ids]
+            n_c = counts.category_counts[cat_id]
+            for i in top_k_candidates(N, block[:, 2], T, n_c, k):
+                A, B, C, D = contingency(N, int(T[i]), n_c, int(block[i, 2]))
+                token = counts.token(int(token_ids[i]))
+                yield category, (chi_squared(N, A, B, C, D), token)
+
+    def mapper_binary(self, input_path, input_uri):
+        """
+        Score all records of a memory mapped binary counts file in one task.
+        """
+        counts = CountsReader(input_path)
+        if self.options.vectorized:
+            yield from self.score_records_vectorized(counts, 0, counts.n_records)
+        else:
+            yield from self.score_records(counts, 0, counts.n_records)
+
+    def mapper_init_binary(self):
+        """
+        Memory map the --counts file once per task.
+        """
+        self.counts = CountsReader(self.options.counts)
+
+    def mapper_binary_range(self, start, stop):
+        """
+        Score the records of one "start<TAB>stop" range of the --counts file.
+        """
+        if self.options.vectorized:
+            yield from self.score_records_vectorized(self.counts, int(start), int(stop))
+        else:
+            yield from self.score_records(self.counts, int(start), int(stop))
+
+    def combiner(self, key, term_chi_pairs):
+        """
+        Only pass on the local top k tokens of a category, everything below
+        cannot make it into the global top k.
+        """
+        for pair in heapq.nlargest(self.top_k(key), term_chi_pairs):
+            yield key, pair
+
+    def reducer(self, key, term_chi_pairs):
+        """
+        Keep top k (75 by default) tokens per category.
+        """
+        top_k = heapq.nlargest(self.top_k(key), term_chi_pairs)
+        yield key, format_top_k(top_k)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Compare approximate top-k token lists (e.g. of a sampled run) with exact ones.
+
+Reads two main.py outputs and reports overlap@k per category: the share of
+the exact top k tokens that are also in the approximate top k. Outputs with
+several metrics are compared block by block.
+Example: python evaluate_sample.py output_exact.txt output_sample.txt --k 75
+"""
+
+import argparse
+import sys
+
+
+def load_top_k(path):
+    """
+    The ranked tokens per category ("metric.category" for several metrics) of a main.py output.
+    """
+    result = {}
+    metric = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("# "):
+                metric = line[2:]
+            elif "\t" in line:
+                category, value = line.split("\t")
+                key = f"{metric}.{category}" if metric else category
+                result[key] = [pair.rsplit(":", 1)[0] for pair in value.split(" ")]
+    return result
+
+
+def overlap_at_k(exact, approx, k):
+    """
+    Share of the exact top k tokens found in the approximate top k.
+    """
+    exact_top = set(exact[:k])
+    if not exact_top:
+        return 1.0
+    return len(exact_top.intersection(approx[:k])) / len(exact_top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="overlap@k of approximate top-k lists")
+    parser.add_argument("exact", help="main.py output of the exact run")
+    parser.add_argument("approx", help="main.py output of the approximate run")
+    parser.add_argument("--k", type=int, default=75, help="Number of top tokens compared")
+    args = parser.parse_args()
+
+    exact = load_top_k(args.exact)
+    approx = load_top_k(args.approx)
+
+    overlaps = []
+    for key in sorted(exact):
+        overlap = overlap_at_k(exact[key], approx.get(key, []), args.k)
+        overlaps.append(overlap)
+        print(f"{key}\t{overlap:.3f}")
+    if not overlaps:
+        sys.exit(f"No categories in {args.exact}")
+    print(f"mean\t{sum(overlaps) / len(overlaps):.3f}")
+    print(f"min\t{min(overlaps):.3f}")
+
+
+if __name__ == "__main__":
+    main()
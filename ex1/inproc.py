@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Single process alternative to running preprocessor.py and chisquared.py as two MRJobs.
+Example: python inproc.py reviews_devset.json --stopwords stopwords.txt > output.txt
+"""
+
+import argparse
+import heapq
+import sys
+
+from chisquared import format_top_k
+from preprocessor import load_stopwords
+from protocols import decode_review
+from scoring import DEFAULT_K, METRICS, contingency, parse_metrics
+from tokenizer import extract_tokens
+
+
+class CountTables:
+    """
+    Category, token and token-category document counts.
+
+    Tokens and categories are mapped to integer ids once, all counters are
+    indexed by these ids instead of the "TC.token.category" string keys.
+    """
+
+    def __init__(self):
+        self.category_ids = {}
+        self.categories = []
+        self.category_counts = []
+        self.token_ids = {}
+        self.tokens = []
+        self.token_counts = []
+        # One {token_id: count} dict per category id
+        self.pair_counts = []
+
+    @property
+    def n(self):
+        """
+        Total number of documents.
+        """
+        return sum(self.category_counts)
+
+    def category_id(self, category):
+        cat_id = self.category_ids.get(category)
+        if cat_id is None:
+            cat_id = self.category_ids[category] = len(self.categories)
+            self.categories.append(category)
+            self.category_counts.append(0)
+            self.pair_counts.append({})
+        return cat_id
+
+    def token_id(self, token):
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            token_id = self.token_ids[token] = len(self.tokens)
+            self.tokens.append(token)
+            self.token_counts.append(0)
+        return token_id
+
+    def add(self, category, tokens):
+        """
+        Count one document of a category containing the given distinct tokens.
+        """
+        cat_id = self.category_id(category)
+        self.category_counts[cat_id] += 1
+        pairs = self.pair_counts[cat_id]
+        token_counts = self.token_counts
+        for token in tokens:
+            token_id = self.token_id(token)
+            token_counts[token_id] += 1
+            pairs[token_id] = pairs.get(token_id, 0) + 1
+
+
+def count_reviews(lines, stopwords, tables=None):
+    """
+    Tokenize JSON review lines and count them into a CountTables instance.
+    """
+    if tables is None:
+        tables = CountTables()
+    for line in lines:
+        data = decode_review(line)
+        text = data.get("reviewText", "").lower()
+        category = data.get("category", "")
+        tables.add(category, extract_tokens(text, stopwords))
+    return tables
+
+
+def top_k_per_category(tables, metrics=(("chi2", DEFAULT_K),)):
+    """
+    Compute the scores of every metric and keep its top k tokens per category.
+    Returns the formatted "token:score ..." line per output key, exactly as
+    ChiSquaredJob.reducer would emit it (metric.category keys with several metrics).
+    """
+    N = tables.n
+    tokens = tables.tokens
+    token_counts = tables.token_counts
+
+    result = {}
+    for cat_id, category in enumerate(tables.categories):
+        n_c = tables.category_counts[cat_id]
+
+        for name, k in metrics:
+
+            def term_score_pairs(pairs=tables.pair_counts[cat_id], metric=METRICS[name]):
+                for token_id, A in pairs.items():
+                    A, B, C, D = contingency(N, token_counts[token_id], n_c, A)
+                    yield metric(N, A, B, C, D), tokens[token_id]
+
+            key = category if len(metrics) == 1 else f"{name}.{category}"
+            result[key] = format_top_k(heapq.nlargest(k, term_score_pairs()))
+    return result
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="In-process chi-squared engine")
+    parser.add_argument("inputs", nargs="+", help="JSON lines review files")
+    parser.add_argument("--stopwords", required=True, help="Path to the stopwords file")
+    parser.add_argument(
+        "--metrics",
+        default="chi2",
+        type=parse_metrics,
+        help="Comma separated metrics with optional top k, e.g. chi2:75,mi:50,llr",
+    )
+    return parser.parse_args(argv)
+
+
+def run(argv):
+    """
+    Count and score the inputs given as preprocessor.py arguments.
+    """
+    args = parse_args(argv)
+    stopwords = load_stopwords(args.stopwords)
+
+    tables = CountTables()
+    for path in args.inputs:
+        with open(path, "r", encoding="utf-8") as f:
+            count_reviews(f, stopwords, tables)
+
+    return top_k_per_category(tables, args.metrics)
+
+
+if __name__ == "__main__":
+    for category, value in sorted(run(sys.argv[1:]).items()):
+        print(f"{category}\t{value}")
@@ -0,0 +1,122 @@
+"""
+Memory mapped lookup table for the "key\tcount" side tables of chisquared.py.
+
+The table is built once by the driver. Mappers map it read-only, so all tasks
+on a node share the same pages through the page cache instead of every task
+building its own dict.
+
+Layout (native byte order, every section padded to 8 bytes):
+    header   magic, #entries, #slots
+    offsets  uint32[#entries + 1] into the key blob, keys sorted by their utf-8 bytes
+    counts   int32[#entries]
+    slots    uint32[#slots] open addressing hash table of entry index + 1, 0 is empty
+    keys     utf-8 blob
+"""
+
+from array import array
+import mmap
+import struct
+import zlib
+
+MAGIC = b"LKUP"
+HEADER = struct.Struct("=4sII")
+
+
+def _pad(size):
+    return -size % 8
+
+
+def build_lookup(lines, path):
+    """
+    Build a lookup file from "key\tcount" lines.
+    """
+    entries = []
+    for line in lines:
+        key, value = line.split("\t")
+        entries.append((key.encode("utf-8"), int(value)))
+    entries.sort()
+
+    offsets = array("I", [0])
+    counts = array("i")
+    blob = bytearray()
+    for key, value in entries:
+        blob += key
+        offsets.append(len(blob))
+        counts.append(value)
+
+    # Power of two with a load factor of at most 0.5
+    n_slots = 1
+    while n_slots < 2 * len(entries):
+        n_slots *= 2
+    slots = array("I", bytes(4 * n_slots))
+    for i, (key, _) in enumerate(entries):
+        slot = zlib.crc32(key) & (n_slots - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (n_slots - 1)
+        slots[slot] = i + 1
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(entries), n_slots))
+        f.write(b"\0" * _pad(HEADER.size))
+        for values in (offsets, counts, slots):
+            f.write(values.tobytes())
+            f.write(b"\0" * _pad(len(values) * values.itemsize))
+        f.write(blob)
+
+
+class CountLookup:
+    """
+    Read-only mapping of key to count backed by a memory mapped lookup file.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mmap)
+
+        magic, n_entries, n_slots = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a lookup file")
+        pos = HEADER.size + _pad(HEADER.size)
+
+        arrays = []
+        for count, typecode in ((n_entries + 1, "I"), (n_entries, "i"), (n_slots, "I")):
+            size = count * 4
+            arrays.append(view[pos : pos + size].cast(typecode))
+            pos += size + _pad(size)
+        self.offsets, self.counts, self.slots = arrays
+        self.keys_pos = pos
+        self.mask = n_slots - 1
+        self.last_key = None
+        self.last_count = None
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, key):
+        # TC records arrive sorted by token, consecutive lookups mostly repeat a key
+        if key == self.last_key:
+            return self.last_count
+        encoded = key.encode("utf-8")
+        mask = self.mask
+        slots = self.slots
+        offsets = self.offsets
+        keys = self.mmap
+        base = self.keys_pos
+        slot = zlib.crc32(encoded) & mask
+        i = slots[slot]
+        while i:
+            # Slicing the mmap compares bytes, cheaper than a memoryview slice
+            if keys[base + offsets[i - 1] : base + offsets[i]] == encoded:
+                self.last_key = key
+                self.last_count = self.counts[i - 1]
+                return self.last_count
+            slot = (slot + 1) & mask
+            i = slots[slot]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
@@ -1,10 +1,144 @@
+import argparse
+import contextlib
+import os
+import shutil
 import subprocess
 import sys
+import tempfile
 import time
 import getpass
 
+import inproc
+import parallel
+from binary_counts import CountsBuilder, write_ranges
+from checkpoint import Manifest, input_fingerprint, local_input_bytes
+from lookup import build_lookup
+from preprocessor import CATEGORY_COUNTER_GROUP, PreprocessorJob
+from profiling import Profile
+from scoring import parse_metrics
+from sketch import CountMinSketch, select_candidates
+from writers import QueuedWriter
+
 
 HADOOP_STREAMING_JAR = "/usr/lib/hadoop/tools/lib/hadoop-streaming-3.3.6.jar"
+# Completed stages and their input fingerprints, see checkpoint.py
+MANIFEST_PATH = "counts_manifest.json"
+
+
+def parse_args():
+    """
+    Parse driver options, all remaining arguments are passed on to the jobs.
+    """
+    parser = argparse.ArgumentParser(description="Chi-squared pipeline driver")
+    parser.add_argument(
+        "--engine",
+        choices=["mrjob", "inproc", "parallel"],
+        default="mrjob",
+        help="mrjob: run preprocessor.py and chisquared.py as MRJobs, "
+        "inproc: count and score in this process (small and mid-sized inputs), "
+        "parallel: count local inputs with a process pool (see --workers), "
+        "then run chisquared.py",
+    )
+    parser.add_argument(
+        "--intermediate",
+        choices=["text", "binary"],
+        default="text",
+        help="Format of the counts passed from preprocessor.py to chisquared.py, "
+        "binary writes a single memory mappable counts.bin (mrjob engine only)",
+    )
+    parser.add_argument(
+        "--count-store",
+        metavar="PATH",
+        help="Persistent binary counts file. The inputs are counted as a delta, "
+        "merged into the store and the chi-squared values are recomputed from "
+        "the merged counts (implies --intermediate binary)",
+    )
+    parser.add_argument(
+        "--direct-output",
+        action="store_true",
+        help="preprocessor.py writes its output directly to an output directory "
+        "(on HDFS if available) which chisquared.py reads with "
+        "--join-token-counts, instead of streaming it through this driver",
+    )
+    parser.add_argument(
+        "--approximate",
+        action="store_true",
+        help="Count the token-category pairs in Count-Min sketches first and only "
+        "recount the candidates for the top k exactly in a second preprocessor "
+        "pass (see sketch.py, --sketch_width and --sketch_depth size the sketches)",
+    )
+    parser.add_argument(
+        "--token-lookup",
+        action="store_true",
+        help="Build the token counts once into a memory mapped lookup file "
+        "which all chisquared.py mappers share instead of loading a dict each",
+    )
+    parser.add_argument(
+        "--join-token-counts",
+        action="store_true",
+        help="Join the token counts with the category-token counts in the "
+        "shuffle of chisquared.py instead of shipping them to every mapper",
+    )
+    parser.add_argument(
+        "--vectorized",
+        action="store_true",
+        help="Score the chi-squared values with NumPy in chisquared.py",
+    )
+    parser.add_argument(
+        "--metrics",
+        default="chi2",
+        help="Feature scoring metrics of chisquared.py with optional top k, "
+        "e.g. chi2:75,mi:50,llr; one block of output per metric",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reuse the outputs of a completed preprocessor stage if its inputs, "
+        "stopwords and options are unchanged and only run the remaining stages",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="Write a JSON report with the time, records and bytes per second, "
+        "shuffled bytes and task times of every stage and the peak memory to PATH",
+    )
+    args, job_args = parser.parse_known_args()
+    try:
+        args.metrics = parse_metrics(args.metrics)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.count_store:
+        args.intermediate = "binary"
+    if args.intermediate == "binary" and args.engine != "mrjob":
+        parser.error("--intermediate binary and --count-store require --engine mrjob")
+    if args.direct_output or args.approximate:
+        if args.engine != "mrjob" or args.intermediate == "binary":
+            parser.error(
+                "--direct-output and --approximate require --engine mrjob and --intermediate text"
+            )
+    if args.direct_output and args.approximate:
+        parser.error("--direct-output cannot be combined with --approximate")
+    if args.direct_output:
+        args.join_token_counts = True
+    if args.vectorized and [name for name, _ in args.metrics] != ["chi2"]:
+        parser.error("--vectorized only supports --metrics chi2")
+    if args.resume and args.engine == "inproc":
+        parser.error("--resume requires intermediate outputs, not --engine inproc")
+    if args.engine == "inproc" and (
+        args.token_lookup or args.join_token_counts or args.vectorized
+    ):
+        parser.error(
+            "--token-lookup, --join-token-counts and --vectorized apply to chisquared.py, "
+            "not --engine inproc"
+        )
+    if args.join_token_counts and (
+        args.intermediate == "binary" or args.token_lookup or args.vectorized
+    ):
+        parser.error(
+            "--join-token-counts cannot be combined with --intermediate binary, "
+            "--token-lookup or --vectorized"
+        )
+    return args, job_args
 
 
 def hdfs_available():
@@ -25,7 +159,8 @@ def hdfs_available():
 
 def get_handles(base_name="counts"):
     """
-    Provide handles depending on user and HDFS availability   
+    Provide handles depending on user and HDFS availability.
+    Every output is written by its own QueuedWriter thread.
     """
     user = getpass.getuser()
     use_hdfs = hdfs_available()
@@ -51,42 +186,56 @@ def get_handles(base_name="counts"):
             for k, path in paths.items()
         }
 
-        handles = {k: proc.stdin for k, proc in procs.items()}
+        handles = {k: QueuedWriter(k, proc.stdin) for k, proc in procs.items()}
         wait_procs = list(procs.values())
     else:
         print("[INFO] HDFS not found, writing outputs to local files", file=sys.stderr)
-        handles = {k: open(path, "w") for k, path in paths.items()}
+        handles = {k: QueuedWriter(k, open(path, "w")) for k, path in paths.items()}
         wait_procs = []
 
     return handles, wait_procs, paths, use_hdfs
 
 
-def run_preprocessor(use_hdfs, handles, wait_procs):
+def runner_args(use_hdfs):
     """
-    Start Preprocessor MRJob.
+    MRJob arguments selecting the Hadoop runner if HDFS is available.
     """
-    command = ["python", "preprocessor.py"] + sys.argv[1:]
     if use_hdfs:
-        command = [
-            "python",
-            "preprocessor.py",
-            "--hadoop-streaming-jar",
-            HADOOP_STREAMING_JAR,
-            "-r",
-            "hadoop",
-        ] + sys.argv[1:]
+        return ["--hadoop-streaming-jar", HADOOP_STREAMING_JAR, "-r", "hadoop"]
+    return []
+
+
+def start_job(script, use_hdfs, job_args, profile=None, stage=None):
+    """
+    Start an MRJob script, on Hadoop if HDFS is available.
+    When profiling, the counters the job logs are collected for the stage.
+    """
+    command = ["python", script] + runner_args(use_hdfs) + job_args
 
     print(f"Running {' '.join(command)}", file=sys.stderr)
-    preprocessor = subprocess.Popen(
+    proc = subprocess.Popen(
         command,
         stdout=subprocess.PIPE,
-        stderr=sys.stderr,
+        stderr=subprocess.PIPE if profile else sys.stderr,
         text=True,
         bufsize=1,
     )
+    if profile:
+        profile.watch(stage, proc)
+    return proc
+
+
+def run_preprocessor(use_hdfs, handles, wait_procs, job_args, profile=None):
+    """
+    Start Preprocessor MRJob.
+    """
+    preprocessor = start_job("preprocessor.py", use_hdfs, job_args, profile, "preprocessor")
 
     n = 0
+    # Time spent routing the lines, without waiting for the job's output
+    demux_seconds = 0.0
     for line in preprocessor.stdout:
+        start = time.perf_counter()
         key, value = line.strip().split("\t")
         if key.startswith("TC"):
             handles["category_token"].write(line)
@@ -97,61 +246,263 @@ def run_preprocessor(use_hdfs, handles, wait_procs):
         elif key.startswith("T"):
             _, token, _ = key.split(".")
             handles["token"].write(f"{token}\t{value}\n")
+        demux_seconds += time.perf_counter() - start
+
+    preprocessor.wait()
+    if preprocessor.returncode != 0:
+        print("Job failed", file=sys.stderr)
+        sys.exit()
+
+    close_handles(handles, wait_procs, profile)
+    if profile:
+        profile.stage("preprocessor")["demux_seconds"] = demux_seconds
+
+    return str(n)
+
+
+def run_preprocessor_approximate(use_hdfs, handles, wait_procs, job_args, metrics, profile=None):
+    """
+    Start Preprocessor MRJob counting the token-category pairs in sketches,
+    select the candidate pairs for the top k of every metric and count these
+    exactly in a second Preprocessor MRJob.
+    """
+    preprocessor = start_job(
+        "preprocessor.py", use_hdfs, job_args + ["--sketch"], profile, "preprocessor"
+    )
+
+    category_counts = {}
+    sketches = {}
+    # The token counts are read twice by select_candidates, a local spool
+    # instead of a dict of the whole vocabulary (the handle may be an HDFS pipe)
+    token_spool = tempfile.TemporaryFile("w+", encoding="utf-8")
+    for line in preprocessor.stdout:
+        key, value = line.strip().split("\t")
+        kind, token, category = key.split(".")
+        if kind == "S":
+            sketches[category] = CountMinSketch.from_string(value)
+        elif kind == "C":
+            handles["category"].write(f"{category}\t{value}\n")
+            category_counts[category] = int(value)
+        elif kind == "T":
+            handles["token"].write(f"{token}\t{value}\n")
+            token_spool.write(f"{token}\t{value}\n")
 
     preprocessor.wait()
     if preprocessor.returncode != 0:
         print("Job failed", file=sys.stderr)
         sys.exit()
 
+    def token_counts():
+        token_spool.seek(0)
+        for line in token_spool:
+            token, value = line.split("\t")
+            yield token, int(value)
+
+    n = sum(category_counts.values())
+    with token_spool:
+        candidates = select_candidates(sketches, token_counts, category_counts, n, metrics)
+    print(f"[INFO] Recounting {len(candidates)} candidate token-category pairs", file=sys.stderr)
+    candidates_path = "counts_candidates.txt"
+    with open(candidates_path, "w", encoding="utf-8") as f:
+        for token, category in sorted(candidates):
+            f.write(f"{token}\t{category}\n")
+
+    recount = start_job(
+        "preprocessor.py",
+        use_hdfs,
+        job_args + ["--candidates", candidates_path],
+        profile,
+        "preprocessor",
+    )
+    for line in recount.stdout:
+        handles["category_token"].write(line)
+
+    recount.wait()
+    if recount.returncode != 0:
+        print("Job failed", file=sys.stderr)
+        sys.exit()
+
+    close_handles(handles, wait_procs, profile)
+
+    return str(n)
+
+
+def run_parallel(handles, wait_procs, job_args, profile=None):
+    """
+    Count local inputs with a process pool instead of the Preprocessor MRJob.
+    """
+    print("Running parallel preprocessor", file=sys.stderr)
+    n = parallel.run(job_args, handles)
+
+    close_handles(handles, wait_procs, profile)
+    if profile:
+        profile.stage("preprocessor")["records"] = n
+
+    return str(n)
+
+
+def close_handles(handles, wait_procs, profile=None):
+    """
+    Close the output handles, log their throughput and wait for pending HDFS uploads.
+    """
     for handle in handles.values():
         handle.close()
+        handle.log_stats()
+        if profile:
+            profile.stage("preprocessor").setdefault("writers", []).append(handle.stats())
     for proc in wait_procs:
         proc.wait()
 
-    return str(n)
 
+def run_preprocessor_binary(
+    use_hdfs, job_args, base_name="counts", count_store=None, profile=None
+):
+    """
+    Start Preprocessor MRJob and save its output as one binary counts file.
+    With a count store the output is added to the counts already stored there.
+    Returns the counts file and the directory of its record ranges, the input
+    of chisquared.py with one map task per range.
+    """
+    local_path = count_store or f"{base_name}.bin"
+    local_ranges = f"{local_path}.ranges"
+    path, ranges = local_path, local_ranges
+    if use_hdfs:
+        path = f"hdfs:///user/{getpass.getuser()}/{os.path.basename(local_path)}"
+        ranges = f"{path}.ranges"
+
+    # The preprocessor output has one record per key, only merging needs the pair dict
+    builder = CountsBuilder(unique_pairs=True)
+    if count_store and os.path.exists(count_store):
+        builder = CountsBuilder.load(count_store)
+        print(f"[INFO] Adding delta to count store with {builder.n} documents", file=sys.stderr)
+
+    preprocessor = start_job("preprocessor.py", use_hdfs, job_args, profile, "preprocessor")
+
+    for line in preprocessor.stdout:
+        key, value = line.strip().split("\t")
+        builder.add_line(key, value)
+
+    preprocessor.wait()
+    if preprocessor.returncode != 0:
+        print("Job failed", file=sys.stderr)
+        sys.exit()
+
+    parts = write_ranges(local_ranges, builder.save(local_path))
+    print(f"[INFO] {local_path} split into {parts} record ranges", file=sys.stderr)
+    if use_hdfs:
+        subprocess.run(["hdfs", "dfs", "-put", "-f", local_path, path], check=True)
+        subprocess.run(["hdfs", "dfs", "-rm", "-r", "-f", "-skipTrash", ranges], check=True)
+        subprocess.run(["hdfs", "dfs", "-put", local_ranges, ranges], check=True)
+
+    return path, ranges
 
-def run_chisquared(paths, n, use_hdfs):
+
+def run_preprocessor_direct(use_hdfs, job_args, base_name="counts", profile=None):
     """
-    Start Chisquared MRJob.
+    Run Preprocessor MRJob in this process, writing its C, T and TC records to
+    an output directory. None of the output passes through the driver, the
+    category counts are taken from the job counters.
+    Returns the output directory, the category counts file and N.
+    """
+    output_dir = f"{base_name}_preprocessor"
+    if use_hdfs:
+        output_dir = f"hdfs:///user/{getpass.getuser()}/{output_dir}"
+        subprocess.run(["hdfs", "dfs", "-rm", "-r", "-f", "-skipTrash", output_dir], check=True)
+    elif os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+
+    args = runner_args(use_hdfs) + job_args + ["--output-dir", output_dir]
+    print(f"Running preprocessor.py {' '.join(args)}", file=sys.stderr)
+    job = PreprocessorJob(args)
+    with job.make_runner() as runner:
+        runner.run()
+        category_counts = category_counters(runner.counters())
+        if profile:
+            profile.stage("preprocessor")["counters"] = runner.counters()
+
+    category_path = f"{base_name}_category.out"
+    with open(category_path, "w", encoding="utf-8") as f:
+        for category, count in sorted(category_counts.items()):
+            f.write(f"{category}\t{count}\n")
+    return output_dir, category_path, str(sum(category_counts.values()))
+
+
+def category_counters(counters):
+    """
+    Sum the document counts per category over the counters of all job steps.
+    """
+    category_counts = {}
+    for step_counters in counters:
+        for category, count in step_counters.get(CATEGORY_COUNTER_GROUP, {}).items():
+            category_counts[category] = category_counts.get(category, 0) + count
+    return category_counts
+
+
+def build_token_lookup(paths, use_hdfs, base_name="counts"):
+    """
+    Build the memory mapped lookup file of the token counts.
+    """
+    path = f"{base_name}_token.idx"
+    if use_hdfs:
+        cat = subprocess.Popen(
+            ["hdfs", "dfs", "-cat", paths["token"]],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        build_lookup(cat.stdout, path)
+        cat.wait()
+    else:
+        with open(paths["token"], "r", encoding="utf-8") as f:
+            build_lookup(f, path)
+    return path
+
+
+def chisquared_args(paths, n, token_lookup=None, join_token_counts=False):
     """
-    command = [
-        "python",
-        "chisquared.py",
+    Arguments of the Chisquared MRJob for the text counts files.
+    """
+    token_args = ["--token_counts", paths["token"]]
+    if token_lookup:
+        token_args = ["--token_lookup", token_lookup]
+    if join_token_counts:
+        token_args = [paths["token"], "--join_token_counts"]
+
+    return [
         paths["category_token"],
         "--category_counts",
         paths["category"],
-        "--token_counts",
-        paths["token"],
+        *token_args,
         "--n",
         n,
     ]
 
-    if use_hdfs:
-        command = [
-            "python",
-            "chisquared.py",
-            "--hadoop-streaming-jar",
-            HADOOP_STREAMING_JAR,
-            "-r",
-            "hadoop",
-        ] + command[2:]
 
-    print(f"Running {' '.join(command)}", file=sys.stderr)
-    chisquared = subprocess.Popen(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=sys.stderr,
-        text=True,
-        bufsize=1,
-    )
+def run_chisquared(use_hdfs, job_args, metrics, profile=None):
+    """
+    Start Chisquared MRJob.
+    """
+    chisquared = start_job("chisquared.py", use_hdfs, job_args, profile, "chisquared")
 
-    all_tokens = set()
     result = {}
     for line in chisquared.stdout:
         category, value = line.split("\t")
-        value = value.strip()
-        result[category] = value
+        result[category] = value.strip()
+
+    print_results(result, metrics)
+
+    chisquared.wait()
+    if chisquared.returncode != 0:
+        print("Job failed", file=sys.stderr)
+        sys.exit()
+
+
+def print_result(result):
+    """
+    Print the top tokens per category in alphabetical order of the
+    categories, followed by the sorted dictionary of all selected tokens.
+    """
+    all_tokens = set()
+    for value in result.values():
         for pair in value.split(" "):
             token, chi2 = pair.split(":")
             all_tokens.add(token)
@@ -160,28 +511,162 @@ def run_chisquared(paths, n, use_hdfs):
         print(f"{category}\t{value}")
     print(" ".join(sorted(all_tokens)))
 
-    chisquared.wait()
-    if chisquared.returncode != 0:
-        print("Job failed", file=sys.stderr)
-        sys.exit()
+
+def print_results(result, metrics):
+    """
+    Print the result of one metric, or one block per metric from metric.category keys.
+    """
+    if len(metrics) == 1:
+        print_result(result)
+        return
+    for name, _ in metrics:
+        print(f"# {name}")
+        print_result(
+            {
+                key.split(".", 1)[1]: value
+                for key, value in result.items()
+                if key.split(".", 1)[0] == name
+            }
+        )
+
+
+def metrics_spec(metrics):
+    """
+    The --metrics option of the jobs for parsed metrics.
+    """
+    return ",".join(f"{name}:{k}" for name, k in metrics)
+
+
+def timed(profile, stage):
+    """
+    Measure the time of a stage when profiling.
+    """
+    if profile:
+        return profile.timed(stage)
+    return contextlib.nullcontext()
+
+
+def run_inproc(job_args, metrics):
+    """
+    Count and score in this process, without MRJobs and intermediate files.
+    """
+    print_results(inproc.run(job_args + ["--metrics", metrics_spec(metrics)]), metrics)
+
+
+def run_preprocessor_stage(args, job_args, profile=None):
+    """
+    Run the preprocessor of the selected engine and intermediate format.
+    Returns whether HDFS is used, the input arguments of the Chisquared MRJob
+    and the outputs the arguments refer to.
+    """
+    if args.intermediate == "binary":
+        use_hdfs = hdfs_available()
+        path, ranges = run_preprocessor_binary(
+            use_hdfs, job_args, count_store=args.count_store, profile=profile
+        )
+        return use_hdfs, [ranges, "--binary", "--counts", path], [path, ranges]
+
+    if args.direct_output:
+        use_hdfs = hdfs_available()
+        output_dir, category_path, n = run_preprocessor_direct(
+            use_hdfs, job_args, profile=profile
+        )
+        chisquared_job_args = [
+            output_dir,
+            "--join_token_counts",
+            "--category_counts",
+            category_path,
+            "--n",
+            n,
+        ]
+        return use_hdfs, chisquared_job_args, [output_dir, category_path]
+
+    handles, wait_procs, paths, use_hdfs = get_handles()
+
+    if args.engine == "parallel":
+        n = run_parallel(handles, wait_procs, job_args, profile)
+    elif args.approximate:
+        n = run_preprocessor_approximate(
+            use_hdfs, handles, wait_procs, job_args, args.metrics, profile
+        )
+    else:
+        n = run_preprocessor(use_hdfs, handles, wait_procs, job_args, profile)
+
+    outputs = list(paths.values())
+    token_lookup = None
+    if args.token_lookup:
+        token_lookup = build_token_lookup(paths, use_hdfs)
+        outputs.append(token_lookup)
+    chisquared_job_args = chisquared_args(paths, n, token_lookup, args.join_token_counts)
+    return use_hdfs, chisquared_job_args, outputs
 
 
 def main():
     print("Starting script", file=sys.stderr)
     start = time.time()
 
-    handles, wait_procs, paths, use_hdfs = get_handles()
+    args, job_args = parse_args()
+    profile = Profile(sys.argv[1:]) if args.profile else None
+
+    if args.engine == "inproc":
+        with timed(profile, "inproc"):
+            run_inproc(job_args, args.metrics)
+        print(f"Total execution time: {time.time() - start:.2f} seconds", file=sys.stderr)
+        if profile:
+            profile.write(args.profile)
+        return
+
+    manifest = Manifest.load(MANIFEST_PATH)
+    fingerprint = input_fingerprint(
+        job_args,
+        {
+            "engine": args.engine,
+            "intermediate": args.intermediate,
+            "count_store": args.count_store,
+            "direct_output": args.direct_output,
+            "approximate": args.approximate,
+            "token_lookup": args.token_lookup,
+            "join_token_counts": args.join_token_counts,
+        },
+    )
+    preprocessed = manifest.completed("preprocessor", fingerprint) if args.resume else None
+    if preprocessed:
+        print("[INFO] Inputs unchanged, reusing the preprocessor outputs", file=sys.stderr)
+        use_hdfs = preprocessed["use_hdfs"]
+        chisquared_job_args = preprocessed["chisquared_args"]
+        if profile:
+            profile.stage("preprocessor")["resumed"] = True
+    else:
+        with timed(profile, "preprocessor") as stage:
+            use_hdfs, chisquared_job_args, outputs = run_preprocessor_stage(
+                args, job_args, profile
+            )
+            if profile:
+                stage["bytes_read"] = local_input_bytes(fingerprint)
+        manifest.complete(
+            "preprocessor",
+            fingerprint,
+            outputs,
+            {"use_hdfs": use_hdfs, "chisquared_args": chisquared_job_args},
+        )
 
-    n = run_preprocessor(use_hdfs, handles, wait_procs)
+    chisquared_job_args = list(chisquared_job_args)
+    if args.vectorized:
+        chisquared_job_args.append("--vectorized")
+    chisquared_job_args += ["--metrics", metrics_spec(args.metrics)]
 
     mid = time.time()
     print(f"Preprocessor execution time: {mid - start:.2f} seconds", file=sys.stderr)
 
-    run_chisquared(paths, n, use_hdfs)
+    with timed(profile, "chisquared"):
+        run_chisquared(use_hdfs, chisquared_job_args, args.metrics, profile)
+    manifest.complete("chisquared", fingerprint, [], {"chisquared_args": chisquared_job_args})
 
     end = time.time()
     print(f"Chisquared execution time: {end - mid:.2f} seconds", file=sys.stderr)
     print(f"Total execution time: {end - start:.2f} seconds", file=sys.stderr)
+    if profile:
+        profile.write(args.profile)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Local multiprocess replacement for running PreprocessorJob without Hadoop.
+
+Like a MapReduce job with a shuffle through local files: every shard counts
+its reviews and spills its (token, category) counts into one file per
+partition of the tokens, every partition is then merged by a worker which
+writes its token and token-category counts to part files. The parent only
+adds up the category counts and copies the part files to the outputs.
+Example: python parallel.py reviews_devset.json --stopwords stopwords.txt --workers 16
+"""
+
+import argparse
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import zlib
+from collections import Counter
+from multiprocessing import Pool
+
+from preprocessor import load_stopwords
+from protocols import decode_review
+from tokenizer import extract_tokens
+
+# Number of shards per worker, more shards even out slow and fast shards
+SHARDS_PER_WORKER = 4
+
+# Number of token partitions per worker, each merged by one task
+PARTITIONS_PER_WORKER = 2
+
+# Stopwords of a worker process, loaded by init_worker
+stopwords = set()
+
+
+def shard_ranges(path, shards):
+    """
+    Split a file into byte ranges of roughly equal size.
+    """
+    size = os.path.getsize(path)
+    step = max(1, -(-size // shards))
+    return [(path, start, min(start + step, size)) for start in range(0, size, step)]
+
+
+def read_shard(path, start, end):
+    """
+    Yield the lines whose first byte lies in [start, end).
+    A line crossing the end of the range belongs to this shard, the partial
+    line at the start belongs to the previous one.
+    """
+    with open(path, "rb") as f:
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line
+
+
+def init_worker(stopwords_path):
+    """
+    Load the stopwords once per worker process.
+    """
+    global stopwords
+    stopwords = load_stopwords(stopwords_path)
+
+
+def partition(token, partitions):
+    """
+    Partition of a token, the same in every process (str hashes are salted).
+    """
+    return zlib.crc32(token.encode("utf-8")) % partitions
+
+
+def count_shard(task):
+    """
+    Same logic as PreprocessorJob.mapper and combiner for one byte range.
+    Spills the (token, category) counts of the shard into one file per token
+    partition in directory and returns the category counter of the shard.
+    """
+    shard, index, directory, partitions = task
+    category_counts = Counter()
+    pair_counts = Counter()
+
+    for line in read_shard(*shard):
+        data = decode_review(line)
+        text = data.get("reviewText", "").lower()
+        category = data.get("category", "")
+        tokens = extract_tokens(text, stopwords)
+
+        category_counts[category] += 1
+        pair_counts.update((token, category) for token in tokens)
+
+    spills = [{} for _ in range(partitions)]
+    for pair, value in pair_counts.items():
+        spills[partition(pair[0], partitions)][pair] = value
+    for p, spill in enumerate(spills):
+        with open(os.path.join(directory, f"spill-{p:05d}-{index:05d}"), "wb") as f:
+            pickle.dump(spill, f, pickle.HIGHEST_PROTOCOL)
+
+    return category_counts
+
+
+def merge_partition(task):
+    """
+    Merge the spills of one token partition and write its token-category and
+    token counts (a token total is the sum over its categories, every review
+    has one category) to part files. Returns the paths of the part files.
+    """
+    p, shards, directory = task
+    pair_counts = Counter()
+    for index in range(shards):
+        path = os.path.join(directory, f"spill-{p:05d}-{index:05d}")
+        with open(path, "rb") as f:
+            pair_counts.update(pickle.load(f))
+        os.remove(path)
+
+    token_counts = Counter()
+    pairs_path = os.path.join(directory, f"part-category_token-{p:05d}")
+    with open(pairs_path, "w", encoding="utf-8") as f:
+        for (token, category), value in pair_counts.items():
+            token_counts[token] += value
+            f.write(f"TC.{token}.{category}\t{value}\n")
+
+    tokens_path = os.path.join(directory, f"part-token-{p:05d}")
+    with open(tokens_path, "w", encoding="utf-8") as f:
+        for token, value in token_counts.items():
+            f.write(f"{token}\t{value}\n")
+
+    return pairs_path, tokens_path
+
+
+def count_parallel(inputs, stopwords_path, handles, workers=None):
+    """
+    Count all input files in a process pool, merge the partitions in the pool
+    and write the counts in the same format as main.run_preprocessor.
+    Returns the total number of documents.
+    """
+    workers = workers or os.cpu_count()
+    shards = []
+    for path in inputs:
+        shards.extend(shard_ranges(path, workers * SHARDS_PER_WORKER))
+    partitions = workers * PARTITIONS_PER_WORKER
+
+    directory = tempfile.mkdtemp(prefix="parallel-")
+    try:
+        category_counts = Counter()
+        with Pool(workers, initializer=init_worker, initargs=(stopwords_path,)) as pool:
+            tasks = [(shard, i, directory, partitions) for i, shard in enumerate(shards)]
+            for categories in pool.imap_unordered(count_shard, tasks):
+                category_counts.update(categories)
+
+            tasks = [(p, len(shards), directory) for p in range(partitions)]
+            for paths in pool.imap_unordered(merge_partition, tasks):
+                for name, path in zip(("category_token", "token"), paths):
+                    with open(path, encoding="utf-8") as f:
+                        for line in f:
+                            handles[name].write(line)
+                    os.remove(path)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    for category, value in category_counts.items():
+        handles["category"].write(f"{category}\t{value}\n")
+    return sum(category_counts.values())
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Multiprocess preprocessor")
+    parser.add_argument("inputs", nargs="+", help="Local JSON lines review files")
+    parser.add_argument("--stopwords", required=True, help="Path to the stopwords file")
+    parser.add_argument("--workers", type=int, help="Number of processes (default: all cores)")
+    return parser.parse_args(argv)
+
+
+def run(argv, handles):
+    """
+    Count the inputs given as preprocessor.py arguments into the handles.
+    """
+    args = parse_args(argv)
+    return count_parallel(args.inputs, args.stopwords, handles, args.workers)
+
+
+if __name__ == "__main__":
+    handles = {
+        "category": open("counts_category.out", "w"),
+        "token": open("counts_token.out", "w"),
+        "category_token": open("counts_category_token.out", "w"),
+    }
+    print(run(sys.argv[1:], handles))
+    for handle in handles.values():
+        handle.close()
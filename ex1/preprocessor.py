@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 """
 Example: python preprocessor.py reviews_devset.json --stopwords stopwords.txt > preprocessor.out
+Add --sample_fraction 0.1 or --sample_size 1000 to count a sample of the reviews per category.
+Add --sketch to count the TC records in Count-Min sketches, --candidates to only count the listed ones.
 """
 
-from mrjob.protocol import RawProtocol, JSONValueProtocol
+from mrjob.protocol import RawProtocol
 from mrjob.job import MRJob
-import re
+from mrjob.step import MRStep
+from collections import Counter, OrderedDict
+import hashlib
+import heapq
+
+from protocols import ReviewProtocol
+from sketch import DEFAULT_DEPTH, DEFAULT_WIDTH, CountMinSketch, merge_strings
+from tokenizer import extract_tokens
 
 
 def load_stopwords(path: str) -> set[str]:
@@ -17,20 +26,30 @@ def load_stopwords(path: str) -> set[str]:
         stopwords = set(line.strip() for line in f if line.strip())
     return stopwords
 
-# Regular expression defining what separates words in the text
-# This regex matches spaces, tabs, digits, punctuation, and special characters
-WORD_RE = re.compile(
-    r"[\s\t\d\(\)\[\]\{\}\.\!\?\,\;\:\+\=\-\_\"\'`\~\#\@\&\*\%\€\$\§\\\/]+"
-)
+
+# Counter group of the document counts per category
+CATEGORY_COUNTER_GROUP = "categories"
+
+
+def sample_priority(data):
+    """
+    Deterministic pseudo-random number in [0, 1) of a review, derived from its
+    category and text, so every run samples the same reviews.
+    """
+    key = f"{data.get('category', '')}\t{data.get('reviewText', '')}".encode("utf-8")
+    return int.from_bytes(hashlib.md5(key).digest()[:8], "big") / 2**64
 
 
 class PreprocessorJob(MRJob):
 
-    # Define input protocol as JSON values
-    INPUT_PROTOCOL = JSONValueProtocol
+    # Define input protocol as JSON values, decoding only reviewText and category
+    INPUT_PROTOCOL = ReviewProtocol
     # Define output protocol as raw key-value pairs
     OUTPUT_PROTOCOL = RawProtocol
 
+    # Shipped with the job, tokenizer and protocol are shared with the other engines
+    FILES = ["tokenizer.py", "protocols.py", "sketch.py", "scoring.py"]
+
     def configure_args(self):
         """
         Configure command-line arguments for the job.
@@ -38,6 +57,91 @@ class PreprocessorJob(MRJob):
         """
         super(PreprocessorJob, self).configure_args()
         self.add_file_arg("--stopwords", help="Path to the stopwords file")
+        self.add_passthru_arg(
+            "--buffer_size",
+            type=int,
+            default=0,
+            help="Number of keys counted inside the mapper before the least "
+            "recently used ones are emitted, 0 disables in-mapper combining",
+        )
+        self.add_passthru_arg(
+            "--sample_fraction",
+            type=float,
+            default=1.0,
+            help="Only count this fraction of the reviews of every category, "
+            "chosen by a hash of the review",
+        )
+        self.add_passthru_arg(
+            "--sample_size",
+            type=int,
+            default=0,
+            help="Only count this many reviews per category, chosen by a hash "
+            "of the review in a first step, 0 counts all reviews",
+        )
+        self.add_passthru_arg(
+            "--sketch",
+            action="store_true",
+            help="Count the token-category pairs of every category in a Count-Min "
+            "sketch, emitted as S.*.category records, instead of TC records",
+        )
+        self.add_passthru_arg("--sketch_width", type=int, default=DEFAULT_WIDTH)
+        self.add_passthru_arg("--sketch_depth", type=int, default=DEFAULT_DEPTH)
+        self.add_file_arg(
+            "--candidates",
+            help="File of \"token\\tcategory\" lines, only the TC records of these "
+            "pairs are counted and no C or T records",
+        )
+
+    def steps(self):
+        """
+        With --sample_size a first step selects the reviews of every category
+        with the smallest sample priorities before they are counted.
+        With --buffer_size the counting step combines counts in the mapper.
+        """
+        count = MRStep(
+            mapper_init=self.mapper_init,
+            mapper=self.mapper_buffered if self.options.buffer_size else self.mapper,
+            mapper_final=self.mapper_final,
+            combiner=self.combiner,
+            reducer=self.reducer,
+        )
+        if not self.options.sample_size:
+            return [count]
+        sample = MRStep(
+            mapper_init=self.mapper_init_sample,
+            mapper=self.mapper_sample,
+            mapper_final=self.mapper_final_sample,
+            reducer=self.reducer_sample,
+        )
+        return [sample, count]
+
+    def mapper_init_sample(self):
+        self.reservoirs = {}
+
+    def mapper_sample(self, _, data):
+        """
+        Keep the --sample_size reviews with the smallest priorities per category,
+        as a max-heap of (-priority, review).
+        """
+        category = data.get("category", "")
+        reservoir = self.reservoirs.setdefault(category, [])
+        item = (-sample_priority(data), data.get("reviewText", ""))
+        if len(reservoir) < self.options.sample_size:
+            heapq.heappush(reservoir, item)
+        elif item > reservoir[0]:
+            heapq.heapreplace(reservoir, item)
+
+    def mapper_final_sample(self):
+        for category, reservoir in self.reservoirs.items():
+            for priority, text in reservoir:
+                yield category, (-priority, text)
+
+    def reducer_sample(self, category, values):
+        """
+        Emit the reviews of the category with the smallest priorities of all mappers.
+        """
+        for _, text in heapq.nsmallest(self.options.sample_size, values):
+            yield None, {"reviewText": text, "category": category}
 
     def mapper_init(self):
         """
@@ -45,52 +149,125 @@ class PreprocessorJob(MRJob):
         This is called once before processing begins.
         """
         self.stopwords = load_stopwords(self.options.stopwords)
+        self.buffer = OrderedDict()
+        self.category_totals = Counter()
+        self.sketches = {}
 
-    def mapper(self, _, data):
+        self.candidates = None
+        if self.options.candidates:
+            with open(self.options.candidates, "r", encoding="utf-8") as f:
+                self.candidates = {tuple(line.rstrip("\n").split("\t")) for line in f}
+
+    def review_keys(self, data):
         """
-        Process each review document and emit key-value pairs.
-        
+        Process a review document into the keys it counts once.
+
         For each review, this function:
         1. Extracts the review text and category
         2. Tokenizes the review text (splits into words)
         3. Filters out stopwords and single-character tokens
-        4. Emits counts for:
-           - Category occurrences
-           - Token occurrences
-           - Token-category co-occurrences
-        
-        Args:
-            _: Unused key parameter (mrjob convention)
-            data: JSON object containing review data
-            
-        Yields:
-            Key-value pairs for counting categories, tokens, and token-category pairs
-            - "C.*.category" → 1  (Category counter)
-            - "T.token.*" → 1     (Token counter)
-            - "TC.token.category" → 1  (Token-category co-occurrence counter)
+        4. Returns the keys of:
+           - "C.*.category"        Category occurrence
+           - "T.token.*"           Token occurrence
+           - "TC.token.category"   Token-category co-occurrence
+        With --sketch the TC pairs are added to a sketch per category instead,
+        which mapper_final emits. With --candidates only the TC keys of the
+        candidate pairs are returned.
         """
+        # Skip reviews outside of the --sample_fraction sample
+        fraction = self.options.sample_fraction
+        if fraction < 1 and sample_priority(data) >= fraction:
+            return []
+
         # Extract the review text and convert to lowercase
         text = data.get("reviewText", "").lower()
         # Extract the category of the review
         category = data.get("category", "")
 
-        # Split the text into tokens using the regular expression
+        # Split the text into tokens at the separators of WORD_RE
         # Filter out single characters and stopwords
-        tokens = set()
-        for token in WORD_RE.split(text):
-            if token and len(token) > 1 and token not in self.stopwords:
-                tokens.add(token)
+        tokens = extract_tokens(text, self.stopwords)
 
-        # Emit a count for this category
-        yield f"C.*.{category}", 1
-        
-        # For each token, emit counts for:
+        # Recount of the candidate pairs only
+        if self.candidates is not None:
+            candidates = self.candidates
+            return [
+                f"TC.{token}.{category}" for token in tokens if (token, category) in candidates
+            ]
+
+        # Count this category, also reported as a counter
+        keys = [f"C.*.{category}"]
+        self.category_totals[category] += 1
+
+        if self.options.sketch:
+            sketch = self.sketches.get(category)
+            if sketch is None:
+                sketch = self.sketches[category] = CountMinSketch(
+                    self.options.sketch_width, self.options.sketch_depth
+                )
+            for token in tokens:
+                keys.append(f"T.{token}.*")
+                sketch.add(token)
+            return keys
+
+        # For each token, count:
         # 1. The token itself (regardless of category)
         # 2. The token-category pair (co-occurrence)
         for token in tokens:
-            yield f"T.{token}.*", 1
-            yield f"TC.{token}.{category}", 1
+            keys.append(f"T.{token}.*")
+            keys.append(f"TC.{token}.{category}")
+        return keys
+
+    def mapper(self, _, data):
+        """
+        Emit every key of a review with a count of 1, summed by the combiner.
+
+        Args:
+            _: Unused key parameter (mrjob convention)
+            data: JSON object containing review data
+
+        Yields:
+            Key-value pairs for counting categories, tokens, and token-category pairs
+            - "C.*.category" → 1  (Category counter)
+            - "T.token.*" → 1     (Token counter)
+            - "TC.token.category" → 1  (Token-category co-occurrence counter)
+        """
+        for key in self.review_keys(data):
+            yield key, 1
 
+    def mapper_buffered(self, _, data):
+        """
+        In-mapper combining: the counts of the keys of a review are added to
+        the buffer. Once the buffer holds more than --buffer_size keys, the
+        least recently used tenth of it is emitted with partial counts to keep
+        the memory of the mapper bounded.
+        """
+        buffer = self.buffer
+        buffer_size = self.options.buffer_size
+        for key in self.review_keys(data):
+            if key in buffer:
+                buffer[key] += 1
+                buffer.move_to_end(key)
+                continue
+            buffer[key] = 1
+            if len(buffer) > buffer_size:
+                for _ in range(max(1, buffer_size // 10)):
+                    yield buffer.popitem(last=False)
+
+    def mapper_final(self):
+        """
+        Emit the counts left in the in-mapper combining buffer and report the
+        documents per category of this mapper as counters, once per category
+        instead of once per review.
+        """
+        yield from self.buffer.items()
+        self.buffer.clear()
+        for category, count in self.category_totals.items():
+            self.increment_counter(CATEGORY_COUNTER_GROUP, category, count)
+        self.category_totals.clear()
+        for category, sketch in self.sketches.items():
+            yield f"S.*.{category}", sketch.to_string()
+        self.sketches.clear()
 
     def combiner(self, key, values):
         """
@@ -107,6 +284,9 @@ class PreprocessorJob(MRJob):
         Yields:
             The key and the sum of its values
         """
+        if key.startswith("S."):
+            yield key, merge_strings(values)
+            return
         yield key, sum(values)
 
     def reducer(self, key, values):
@@ -116,7 +296,11 @@ class PreprocessorJob(MRJob):
           - "C.*.category" → count
           - "T.token.*" → count
           - "TC.token.category" → count
+          - "S.*.category" → merged Count-Min sketch (with --sketch)
         """
+        if key.startswith("S."):
+            yield key, merge_strings(values)
+            return
         yield key, f"{sum(values)}"
 
 
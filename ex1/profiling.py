@@ -0,0 +1,222 @@
+"""
+Per-stage profile of a main.py run, written as a JSON report with --profile.
+
+The MRJob subprocesses log their counters to stderr after every step. While
+profiling, their stderr is forwarded by a thread which also parses these
+counter blocks. On Hadoop the framework counters provide the records and bytes
+read, the shuffled bytes and the map and reduce task times. Local runners only
+report the job's own counters, there the number of documents is taken from the
+preprocessor's category counters and the bytes read from the input files.
+
+Two reports can be compared, slower stages beyond --threshold are reported as
+regressions (exit status 1).
+Example: python profiling.py profile_before.json profile_after.json
+"""
+
+import argparse
+from contextlib import contextmanager
+import datetime
+import json
+import resource
+import sys
+import threading
+import time
+
+from preprocessor import CATEGORY_COUNTER_GROUP
+
+# Hadoop framework counters summed over all steps of a job, by report field
+FRAMEWORK_COUNTERS = {
+    "records": ["Map input records"],
+    "bytes_read": ["HDFS: Number of bytes read"],
+    "bytes_shuffled": ["Reduce shuffle bytes"],
+    "map_task_ms": ["Total time spent by all map tasks (ms)"],
+    "reduce_task_ms": ["Total time spent by all reduce tasks (ms)"],
+}
+
+
+def forward_counters(stream, steps):
+    """
+    Forward an MRJob's stderr and append every logged "Counters: n" block to steps.
+    """
+    counters = None
+    group = None
+    for line in stream:
+        sys.stderr.write(line)
+        if line.startswith("Counters: "):
+            counters = {}
+            steps.append(counters)
+        elif counters is not None and line.startswith("\t\t") and "=" in line:
+            name, _, value = line.strip().rpartition("=")
+            counters[group][name] = int(value)
+        elif counters is not None and line.startswith("\t"):
+            group = line.strip()
+            counters[group] = {}
+        else:
+            counters = None
+
+
+def counter_metrics(steps):
+    """
+    Report fields computed from the counters of all steps of a job.
+    Records and bytes read only count the first step, which reads the input.
+    """
+    metrics = {}
+    for field, names in FRAMEWORK_COUNTERS.items():
+        values = [
+            sum(
+                value
+                for group in counters.values()
+                for name, value in group.items()
+                if name in names
+            )
+            for counters in steps
+            if any(name in group for group in counters.values() for name in names)
+        ]
+        if values:
+            metrics[field] = values[0] if field in ("records", "bytes_read") else sum(values)
+
+    if "records" not in metrics:
+        documents = [sum(counters.get(CATEGORY_COUNTER_GROUP, {}).values()) for counters in steps]
+        if any(documents):
+            metrics["records"] = sum(documents)
+    return metrics
+
+
+class Profile:
+    """
+    Timings, counters and throughput of the stages of a run.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self.stages = {}
+        self.threads = []
+
+    def stage(self, name):
+        """
+        The dict collecting the measurements of a stage.
+        """
+        return self.stages.setdefault(name, {"counters": []})
+
+    @contextmanager
+    def timed(self, name):
+        stage = self.stage(name)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage["seconds"] = stage.get("seconds", 0.0) + time.perf_counter() - start
+
+    def watch(self, name, proc):
+        """
+        Forward the stderr of a job subprocess and collect its counters.
+        """
+        thread = threading.Thread(
+            target=forward_counters, args=(proc.stderr, self.stage(name)["counters"])
+        )
+        thread.start()
+        self.threads.append(thread)
+
+    def report(self):
+        for thread in self.threads:
+            thread.join()
+
+        stages = {}
+        for name, stage in self.stages.items():
+            # Counters take precedence over the values measured by the driver
+            stage = dict(stage, **counter_metrics(stage["counters"]))
+            seconds = stage.get("seconds")
+            if seconds:
+                if "records" in stage:
+                    stage["records_per_second"] = stage["records"] / seconds
+                if "bytes_read" in stage:
+                    stage["mb_per_second"] = stage["bytes_read"] / (1 << 20) / seconds
+            stages[name] = stage
+
+        # ru_maxrss is in kilobytes on Linux
+        return {
+            "started": self.started,
+            "args": self.args,
+            "stages": stages,
+            "peak_rss_mb": {
+                "driver": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                "jobs": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+            },
+        }
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        print(f"[INFO] Profile written to {path}", file=sys.stderr)
+
+
+def run_args(report):
+    """
+    Arguments of a profiled run without the --profile option itself.
+    """
+    args = []
+    skip = False
+    for arg in report["args"]:
+        if skip:
+            skip = False
+        elif arg == "--profile":
+            skip = True
+        elif not arg.startswith("--profile="):
+            args.append(arg)
+    return args
+
+
+def compare(report, baseline, threshold):
+    """
+    Print the time and throughput of every stage against a baseline report.
+    Returns the number of stages slower than threshold.
+    """
+    regressions = 0
+    if run_args(baseline) != run_args(report):
+        print(f"Baseline ran with other arguments: {' '.join(run_args(baseline))}")
+    print(f"{'stage':<14} {'baseline':>10} {'current':>10} {'speedup':>8} {'records/s':>12}")
+    for name, stage in report["stages"].items():
+        base = baseline["stages"].get(name)
+        if not base or not base.get("seconds") or not stage.get("seconds"):
+            continue
+        speedup = base["seconds"] / stage["seconds"]
+        slower = speedup < 1 / (1 + threshold)
+        regressions += slower
+        records_per_second = stage.get("records_per_second")
+        line = (
+            f"{name:<14} {base['seconds']:>9.2f}s {stage['seconds']:>9.2f}s {speedup:>7.2f}x "
+            + (f"{records_per_second:>12.0f}" if records_per_second else f"{'':>12}")
+        )
+        print(f"{line} SLOWER" if slower else line.rstrip())
+    for process in ("driver", "jobs"):
+        print(
+            f"peak RSS {process:<6} {baseline['peak_rss_mb'][process]:>8.1f} MB "
+            f"{report['peak_rss_mb'][process]:>8.1f} MB"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two main.py --profile reports")
+    parser.add_argument("baseline", help="Report of the earlier run")
+    parser.add_argument("report", help="Report of the current run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown reported as a regression (default 0.1)",
+    )
+    args = parser.parse_args()
+
+    reports = []
+    for path in (args.baseline, args.report):
+        with open(path, "r", encoding="utf-8") as f:
+            reports.append(json.load(f))
+    baseline, report = reports
+    if compare(report, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
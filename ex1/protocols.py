@@ -0,0 +1,58 @@
+"""
+Input protocol that only decodes the review fields used by the jobs.
+
+Reviews carry many fields (reviewerID, helpful, unixReviewTime, ...) but only
+reviewText and category are needed. With orjson installed the line is decoded
+by orjson and projected to these fields. Otherwise the fields are located in
+the line and only their values are decoded with the stdlib json decoder.
+"""
+
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Review fields used by the jobs
+FIELDS = ("reviewText", "category")
+
+_decoder = json.JSONDecoder()
+_field_res = [(field, re.compile(rf'"{field}"\s*:\s*')) for field in FIELDS]
+
+
+def decode_review(line):
+    """
+    Decode a JSON review line (str or bytes) into a dict of the FIELDS it contains.
+
+    An unescaped '"' cannot occur inside a JSON string, so a match of
+    '"field":' is always an object key (the reviews have no nested objects
+    with these keys). Lines where a field is not found are decoded completely.
+    """
+    if orjson is not None:
+        data = orjson.loads(line)
+        return {field: data[field] for field in FIELDS if field in data}
+
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    review = {}
+    for field, field_re in _field_res:
+        match = field_re.search(line)
+        if match is None:
+            data = json.loads(line)
+            return {field: data[field] for field in FIELDS if field in data}
+        review[field] = _decoder.raw_decode(line, match.end())[0]
+    return review
+
+
+class ReviewProtocol:
+    """
+    Drop-in replacement for JSONValueProtocol as INPUT_PROTOCOL of review jobs.
+    """
+
+    def read(self, line):
+        return None, decode_review(line)
+
+    def write(self, key, value):
+        return json.dumps(value).encode("utf-8")
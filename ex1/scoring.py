@@ -0,0 +1,94 @@
+"""
+Feature scoring metrics of a token for a category, shared by the ex1 MRJobs and the ex2 Spark jobs.
+
+All metrics are computed from the same 2x2 contingency table of N documents:
+    A: documents of the category containing the token
+    B: documents of other categories containing the token
+    C: documents of the category not containing the token
+    D: documents of other categories not containing the token
+
+Metrics are selected with a spec like "chi2:75,mi:50,llr", the number is the
+top k kept per category (default 75).
+"""
+
+import math
+
+# Number of tokens kept per category if the spec does not say otherwise
+DEFAULT_K = 75
+
+
+def contingency(N, n_t, n_c, A):
+    """
+    Contingency table (A, B, C, D) from the number of documents N, the token
+    count n_t, the category count n_c and the token-category count A.
+    """
+    B = n_t - A
+    C = n_c - A
+    D = N - A - B - C
+    return A, B, C, D
+
+
+def chi_squared(N, A, B, C, D):
+    """
+    Chi-squared statistic of the contingency table.
+    Only uses arithmetic operators, so it also works on NumPy arrays and Spark columns.
+    """
+    numerator = N * (A * D - B * C) ** 2
+    denominator = (A + B) * (A + C) * (B + D) * (C + D)
+    return numerator / denominator
+
+
+def _observed_expected(N, A, B, C, D):
+    """
+    Observed and expected (under independence) counts of the four cells.
+    """
+    yield A, (A + B) * (A + C) / N
+    yield B, (A + B) * (B + D) / N
+    yield C, (C + D) * (A + C) / N
+    yield D, (C + D) * (B + D) / N
+
+
+def mutual_information(N, A, B, C, D):
+    """
+    Mutual information (in nats) between token occurrence and category membership.
+    """
+    return sum(
+        observed / N * math.log(observed / expected)
+        for observed, expected in _observed_expected(N, A, B, C, D)
+        if observed
+    )
+
+
+def log_likelihood_ratio(N, A, B, C, D):
+    """
+    Dunning's log-likelihood ratio (G statistic) of the contingency table.
+    """
+    return 2 * sum(
+        observed * math.log(observed / expected)
+        for observed, expected in _observed_expected(N, A, B, C, D)
+        if observed
+    )
+
+
+METRICS = {
+    "chi2": chi_squared,
+    "mi": mutual_information,
+    "llr": log_likelihood_ratio,
+}
+
+
+def parse_metrics(spec):
+    """
+    Parse a spec like "chi2:75,mi:50,llr" into [(name, k), ...].
+    """
+    metrics = []
+    for part in spec.split(","):
+        name, _, k = part.strip().partition(":")
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric {name!r}, choose from {', '.join(METRICS)}")
+        k = int(k) if k else DEFAULT_K
+        if k <= 0:
+            raise ValueError(f"Top k of {name!r} must be positive, not {k}")
+        metrics.append((name, k))
+    return metrics
+
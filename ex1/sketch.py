@@ -0,0 +1,178 @@
+"""
+Count-Min sketches of the token-category counts and the selection of the
+candidate tokens which are recounted exactly (main.py --approximate).
+
+A sketch never underestimates a count A. With probability 1 - exp(-depth) it
+overestimates it by at most e / width times the total of the sketch. For fixed
+N, token and category counts every metric of scoring.py is a convex function of
+A which is 0 where token and category are independent. So for A in the interval
+[estimate - error, estimate] the largest score is reached at one of its ends
+and the smallest at one of its ends or 0. A token is a candidate of a category
+if its largest possible score reaches the k-th largest smallest possible score.
+"""
+
+from array import array
+import base64
+import hashlib
+import heapq
+import math
+import zlib
+
+from scoring import METRICS, contingency
+
+DEFAULT_WIDTH = 1 << 14
+DEFAULT_DEPTH = 5
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch of string keys with depth rows of width int32 counters.
+    """
+
+    def __init__(self, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, counts=None):
+        self.width = width
+        self.depth = depth
+        self.counts = counts if counts is not None else array("i", bytes(4 * width * depth))
+
+    def indices(self, key):
+        """
+        Counter index of the key in every row, by double hashing with the two
+        halves of a 64 bit hash (CRC32 with different seeds is not independent).
+        """
+        digest = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+        h1 = digest & 0xFFFFFFFF
+        h2 = (digest >> 32) | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        counts = self.counts
+        for i in self.indices(key):
+            counts[i] += count
+
+    def estimate(self, key, indices=None):
+        """
+        Upper bound of the count of key, indices can be passed in if already computed.
+        """
+        counts = self.counts
+        return min(counts[i] for i in indices or self.indices(key))
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge sketches of different sizes")
+        counts = self.counts
+        for i, count in enumerate(other.counts):
+            if count:
+                counts[i] += count
+
+    @property
+    def total(self):
+        return sum(self.counts[: self.width])
+
+    def error(self):
+        """
+        Overestimation bound which holds with probability 1 - exp(-depth).
+        """
+        return math.ceil(math.e / self.width * self.total)
+
+    def to_string(self):
+        """
+        Compressed text form, for the key-value records of the MRJobs.
+        """
+        data = zlib.compress(self.counts.tobytes())
+        return f"{self.width}:{self.depth}:{base64.b64encode(data).decode('ascii')}"
+
+    @classmethod
+    def from_string(cls, string):
+        width, depth, data = string.split(":")
+        counts = array("i")
+        counts.frombytes(zlib.decompress(base64.b64decode(data)))
+        return cls(int(width), int(depth), counts)
+
+
+def merge_strings(strings):
+    """
+    Merge the text forms of sketches into one.
+    """
+    merged = None
+    for string in strings:
+        sketch = CountMinSketch.from_string(string)
+        if merged is None:
+            merged = sketch
+        else:
+            merged.merge(sketch)
+    return merged.to_string()
+
+
+def score_bounds(metric, N, n_t, n_c, low, high):
+    """
+    Smallest and largest score of a convex metric for A in [low, high].
+    """
+    scores = [metric(N, *contingency(N, n_t, n_c, A)) for A in (low, high)]
+    independent = n_t * n_c / N
+    smallest = 0.0 if low <= independent <= high else min(scores)
+    return smallest, max(scores)
+
+
+def _pair_bounds(sketches, token_counts, category_counts, N, metrics):
+    """
+    Yield (metric, category, smallest, largest, token) for every token with a
+    nonzero estimate in the sketch of a category.
+    """
+    sketch = next(iter(sketches.values()))
+    errors = {category: category_sketch.error() for category, category_sketch in sketches.items()}
+    for token, n_t in token_counts:
+        indices = sketch.indices(token)
+        for category, category_sketch in sketches.items():
+            n_c = category_counts[category]
+            high = min(category_sketch.estimate(token, indices), n_t, n_c)
+            if high == 0:
+                continue
+            low = max(0, high - errors[category])
+            for name, _ in metrics:
+                smallest, largest = score_bounds(METRICS[name], N, n_t, n_c, low, high)
+                # A pair with A = 0 has no TC record and is never scored exactly
+                if low == 0:
+                    smallest = 0.0
+                yield name, category, smallest, largest, token
+
+
+def select_candidates(sketches, token_counts, category_counts, N, metrics):
+    """
+    The (token, category) pairs which can be among the top k of a metric,
+    given the sketches and the exact token and category counts.
+
+    token_counts is a function returning an iterable of (token, n_t), it is
+    read twice: the first pass keeps the k largest lower bounds per metric and
+    category in a heap, the second one keeps the pairs whose upper bound
+    reaches the k-th of them. No bounds of the whole vocabulary are stored.
+    """
+    if not sketches:
+        return set()
+
+    # [metric][category] -> min-heap of the k largest lower bounds
+    lower = {name: {category: [] for category in sketches} for name, _ in metrics}
+    k_of = dict(metrics)
+    for name, category, smallest, _, _ in _pair_bounds(
+        sketches, token_counts(), category_counts, N, metrics
+    ):
+        heap = lower[name][category]
+        if len(heap) < k_of[name]:
+            heapq.heappush(heap, smallest)
+        elif smallest > heap[0]:
+            heapq.heapreplace(heap, smallest)
+
+    thresholds = {}
+    for name, k in metrics:
+        for category, heap in lower[name].items():
+            threshold = heap[0] if len(heap) == k else 0.0
+            # Tolerance for the float rounding of scores between the interval ends
+            thresholds[name, category] = threshold * (1 - 1e-9)
+
+    return {
+        (token, category)
+        for name, category, _, largest, token in _pair_bounds(
+            sketches, token_counts(), category_counts, N, metrics
+        )
+        if largest >= thresholds[name, category]
+    }
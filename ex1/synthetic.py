@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Deterministic generator of synthetic Amazon reviews in the JSON lines format of
+reviews_devset.json, for benchmarks at any scale.
+
+Words are drawn from a Zipfian distribution over a generated vocabulary. Every
+category has its own topic words, drawn for a share of the words of its
+reviews, so the categories have distinctive tokens like the real data.
+Example: python synthetic.py --docs 100000 --categories 22 --seed 1 > synthetic.json
+"""
+
+import argparse
+import itertools
+import json
+import random
+import sys
+
+# Pronounceable syllables the vocabulary is built from
+SYLLABLES = [c + v for c in "bcdfghjklmnprstvwz" for v in "aeiou"]
+# Punctuation put between words, exercising the tokenizer's separators
+SEPARATORS = [" "] * 12 + [", ", ". ", "! ", "? ", " - ", " (", ") ", "'s ", " 2 "]
+
+
+def vocabulary(size):
+    """
+    The first size words of two or more syllables, in a fixed order.
+    """
+    words = []
+    for length in itertools.count(2):
+        for syllables in itertools.product(SYLLABLES, repeat=length):
+            words.append("".join(syllables))
+            if len(words) == size:
+                return words
+
+
+def zipf_cum_weights(size, exponent):
+    """
+    Cumulative weights of the ranks 1..size under a Zipf law, for random.choices.
+    """
+    return list(itertools.accumulate(1 / rank**exponent for rank in range(1, size + 1)))
+
+
+def generate_reviews(
+    docs,
+    categories=6,
+    vocab_size=50_000,
+    exponent=1.1,
+    mean_length=80,
+    topic_words=300,
+    topic_share=0.15,
+    seed=1,
+):
+    """
+    Yield docs review dicts. The same arguments always yield the same reviews.
+    """
+    rng = random.Random(seed)
+    vocab = vocabulary(vocab_size)
+    rng.shuffle(vocab)
+    cum_weights = zipf_cum_weights(vocab_size, exponent)
+    category_names = [f"Category_{i:02d}" for i in range(categories)]
+    # Small vocabularies have fewer topic words per category
+    topic_size = min(topic_words, vocab_size // 2)
+    topics = {
+        category: rng.sample(vocab[vocab_size // 100 :], topic_size)
+        for category in category_names
+    }
+    topic_cum_weights = zipf_cum_weights(topic_size, exponent)
+
+    for i in range(docs):
+        category = rng.choice(category_names)
+        length = max(1, int(rng.expovariate(1 / mean_length)))
+        n_topic = sum(rng.random() < topic_share for _ in range(length))
+        words = rng.choices(vocab, cum_weights=cum_weights, k=length - n_topic)
+        words += rng.choices(topics[category], cum_weights=topic_cum_weights, k=n_topic)
+        rng.shuffle(words)
+
+        text = []
+        for word in words:
+            text.append(word.capitalize() if rng.random() < 0.05 else word)
+            text.append(rng.choice(SEPARATORS))
+
+        yield {
+            "reviewerID": f"A{i:08d}",
+            "asin": f"B{rng.randrange(10**9):09d}",
+            "reviewerName": f"reviewer {rng.randrange(10**6)}",
+            "helpful": [rng.randrange(5), rng.randrange(5, 10)],
+            "reviewText": "".join(text).strip(),
+            "overall": float(rng.randint(1, 5)),
+            "summary": " ".join(words[:3]),
+            "unixReviewTime": 1_300_000_000 + rng.randrange(10**8),
+            "reviewTime": "01 1, 2014",
+            "category": category,
+        }
+
+
+def write_reviews(path, docs, **kwargs):
+    """
+    Write generated reviews to a JSON lines file.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for review in generate_reviews(docs, **kwargs):
+            f.write(json.dumps(review) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic review generator")
+    parser.add_argument("--docs", type=int, default=10_000, help="Number of reviews")
+    parser.add_argument("--categories", type=int, default=6, help="Number of categories")
+    parser.add_argument("--vocab", type=int, default=50_000, help="Vocabulary size")
+    parser.add_argument("--exponent", type=float, default=1.1, help="Zipf exponent")
+    parser.add_argument("--mean-length", type=int, default=80, help="Mean words per review")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+
+    for review in generate_reviews(
+        args.docs,
+        categories=args.categories,
+        vocab_size=args.vocab,
+        exponent=args.exponent,
+        mean_length=args.mean_length,
+        seed=args.seed,
+    ):
+        sys.stdout.write(json.dumps(review) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import os
+
+from binary_counts import CountsBuilder, CountsReader, write_ranges
+
+LINES = [
+    ("C.*.Books", "3"),
+    ("C.*.Café", "2"),
+    ("T.good.*", "4"),
+    ("T.naïve.*", "1"),
+    ("TC.good.Books", "3"),
+    ("TC.good.Café", "1"),
+    ("TC.naïve.Café", "1"),
+]
+
+
+def read_counts(counts):
+    pairs = {
+        (counts.token(token_id), counts.categories[cat_id]): count
+        for token_id, cat_id, count in counts.iter_records()
+    }
+    categories = dict(zip(counts.categories, counts.category_counts))
+    tokens = {counts.token(i): count for i, count in enumerate(counts.token_counts)}
+    return categories, tokens, pairs
+
+
+def build(path, lines, **kwargs):
+    builder = CountsBuilder(**kwargs)
+    for key, value in lines:
+        builder.add_line(key, value)
+    return builder.save(path)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "counts.bin")
+    assert build(path, LINES) == 3
+
+    counts = CountsReader(path)
+    assert counts.n == 5
+    assert counts.n_records == 3
+    assert read_counts(counts) == (
+        {"Books": 3, "Café": 2},
+        {"good": 4, "naïve": 1},
+        {("good", "Books"): 3, ("good", "Café"): 1, ("naïve", "Café"): 1},
+    )
+
+
+def test_unique_pairs(tmp_path):
+    summed, unique = str(tmp_path / "summed.bin"), str(tmp_path / "unique.bin")
+    build(summed, LINES)
+    build(unique, LINES, unique_pairs=True)
+    assert read_counts(CountsReader(unique)) == read_counts(CountsReader(summed))
+
+
+def test_load_and_merge(tmp_path):
+    path = str(tmp_path / "counts.bin")
+    build(path, LINES)
+
+    builder = CountsBuilder.load(path)
+    for key, value in [("C.*.Books", "1"), ("T.good.*", "1"), ("T.new.*", "1"),
+                       ("TC.good.Books", "1"), ("TC.new.Books", "1")]:
+        builder.add_line(key, value)
+    # Replaces the file it was loaded from
+    assert builder.save(path) == 4
+
+    categories, tokens, pairs = read_counts(CountsReader(path))
+    assert categories == {"Books": 4, "Café": 2}
+    assert tokens == {"good": 5, "naïve": 1, "new": 1}
+    assert pairs[("good", "Books")] == 4
+    assert pairs[("new", "Books")] == 1
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def test_empty(tmp_path):
+    path = str(tmp_path / "counts.bin")
+    assert CountsBuilder().save(path) == 0
+    assert read_counts(CountsReader(path)) == ({}, {}, {})
+
+
+def test_ranges(tmp_path):
+    path = str(tmp_path / "counts.bin")
+    build(path, LINES)
+    counts = CountsReader(path)
+
+    directory = str(tmp_path / "ranges")
+    assert write_ranges(directory, counts.n_records, 2) == 2
+    records = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as f:
+            start, stop = map(int, f.read().split("\t"))
+        records.extend(counts.iter_records(start, stop))
+    assert records == list(counts.iter_records())
@@ -0,0 +1,36 @@
+import pytest
+
+from lookup import CountLookup, build_lookup
+
+COUNTS = {"good": 4, "café": 2, "日本": 7, "a": 1, "ab": 3}
+
+
+@pytest.fixture
+def lookup(tmp_path):
+    path = str(tmp_path / "counts.idx")
+    build_lookup([f"{key}\t{value}\n" for key, value in COUNTS.items()], path)
+    return CountLookup(path)
+
+
+def test_round_trip(lookup):
+    assert len(lookup) == len(COUNTS)
+    for key, value in COUNTS.items():
+        assert lookup[key] == value
+    # Repeated keys are answered from the last lookup
+    assert lookup["ab"] == lookup["ab"] == 3
+
+
+def test_misses(lookup):
+    for key in ("b", "abc", "cafe", "日", ""):
+        with pytest.raises(KeyError):
+            lookup[key]
+        assert lookup.get(key) is None
+    assert lookup.get("missing", 0) == 0
+    assert lookup.get("good", 0) == 4
+
+
+def test_not_a_lookup_file(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"\0" * 16)
+    with pytest.raises(ValueError):
+        CountLookup(str(path))
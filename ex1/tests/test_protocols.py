@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import protocols
+from protocols import decode_review
+
+
+@pytest.fixture(params=["orjson", "fallback"])
+def decoder(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(protocols, "orjson", None)
+    return decode_review
+
+
+def test_escaped_quotes(decoder):
+    # The key of a field inside a string value is escaped and not matched
+    text = 'He said "great", "category": "fake" and left'
+    line = '{"reviewText": ' + json.dumps(text) + ', "category": "Books"}'
+    assert decoder(line) == {"reviewText": text, "category": "Books"}
+
+
+def test_key_order(decoder):
+    line = json.dumps({"category": "Books", "overall": 5.0, "reviewText": "Nice"})
+    assert decoder(line) == {"reviewText": "Nice", "category": "Books"}
+
+
+def test_missing_field(decoder):
+    assert decoder('{"reviewText": "Nice", "overall": 5.0}') == {"reviewText": "Nice"}
+    assert decoder('{"overall": 5.0}') == {}
+
+
+def test_bytes_and_unicode(decoder):
+    line = json.dumps({"reviewText": "Café ☃", "category": "Books"}).encode("utf-8")
+    assert decoder(line) == {"reviewText": "Café ☃", "category": "Books"}
+
+
+def test_fallback_matches_json(monkeypatch):
+    monkeypatch.setattr(protocols, "orjson", None)
+    review = {
+        "reviewerID": "A1",
+        "reviewText": "Tab\there, newline\nthere, \"quoted\" \\ slash",
+        "helpful": [0, 1],
+        "category": "Patio_Lawn_and_Garden",
+    }
+    line = json.dumps(review)
+    assert decode_review(line) == {field: review[field] for field in protocols.FIELDS}
@@ -0,0 +1,71 @@
+import pytest
+
+from sketch import CountMinSketch, merge_strings, select_candidates
+
+
+def test_estimate_never_underestimates():
+    sketch = CountMinSketch(width=16, depth=3)
+    counts = {f"token{i}": i for i in range(50)}
+    for key, count in counts.items():
+        sketch.add(key, count)
+    for key, count in counts.items():
+        assert sketch.estimate(key) >= count
+
+
+def test_merge():
+    first, second, both = (CountMinSketch(width=64, depth=4) for _ in range(3))
+    for key, count in [("good", 2), ("café", 1)]:
+        first.add(key, count)
+        both.add(key, count)
+    for key, count in [("good", 1), ("bad", 5)]:
+        second.add(key, count)
+        both.add(key, count)
+
+    first.merge(second)
+    assert first.counts == both.counts
+    assert first.total == 9
+
+
+def test_merge_different_sizes():
+    with pytest.raises(ValueError):
+        CountMinSketch(width=64).merge(CountMinSketch(width=32))
+
+
+def test_string_round_trip():
+    sketch = CountMinSketch(width=128, depth=5)
+    sketch.add("café", 3)
+    sketch.add("good")
+
+    copy = CountMinSketch.from_string(sketch.to_string())
+    assert (copy.width, copy.depth) == (128, 5)
+    assert copy.counts == sketch.counts
+    assert copy.estimate("café") == sketch.estimate("café")
+
+
+def test_merge_strings():
+    first, second = CountMinSketch(width=32, depth=2), CountMinSketch(width=32, depth=2)
+    first.add("good", 2)
+    second.add("good", 3)
+    merged = CountMinSketch.from_string(merge_strings([first.to_string(), second.to_string()]))
+    assert merged.estimate("good") == 5
+
+
+def test_select_candidates_empty():
+    assert select_candidates({}, lambda: iter(()), {}, 0, [("chi2", 75)]) == set()
+
+
+def test_select_candidates_exact_sketches():
+    # Wide sketches without collisions estimate every count exactly
+    pairs = {("good", "Books"): 8, ("good", "Music"): 1, ("bad", "Music"): 6, ("meh", "Books"): 1}
+    sketches = {"Books": CountMinSketch(width=4096), "Music": CountMinSketch(width=4096)}
+    for (token, category), count in pairs.items():
+        sketches[category].add(token, count)
+    token_counts = {"good": 9, "bad": 6, "meh": 1}
+    category_counts = {"Books": 10, "Music": 10}
+
+    candidates = select_candidates(
+        sketches, lambda: iter(token_counts.items()), category_counts, 20, [("chi2", 1)]
+    )
+    assert ("good", "Books") in candidates
+    assert ("bad", "Music") in candidates
+    assert candidates <= set(pairs)
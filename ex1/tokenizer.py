@@ -0,0 +1,42 @@
+"""
+Tokenizer shared by the ex1 jobs and the ex2 Spark notebooks.
+
+A review text is split at whitespace, digits, punctuation and special
+characters (WORD_RE). For ASCII texts, which are the vast majority of the
+reviews, the fast path maps every separator to a space with str.translate
+and splits with str.split(), which yields the same tokens without running
+the regex engine (see bench_tokenizer.py for the check and timings).
+"""
+
+import re
+
+# Pattern defining what separates words in the text
+# This regex matches spaces, tabs, digits, punctuation, and special characters
+WORD_PATTERN = r"[\s\t\d\(\)\[\]\{\}\.\!\?\,\;\:\+\=\-\_\"\'`\~\#\@\&\*\%\€\$\§\\\/]+"
+WORD_RE = re.compile(WORD_PATTERN)
+
+# Translation table mapping every ASCII separator of WORD_RE to a space
+SEPARATORS = {code: " " for code in range(128) if WORD_RE.fullmatch(chr(code))}
+
+
+def extract_tokens(text: str, stopwords: set[str]) -> set[str]:
+    """
+    Split an already lowercased text into its distinct tokens.
+    Single characters and stopwords are filtered out.
+    """
+    if text.isascii():
+        words = text.translate(SEPARATORS).split()
+    else:
+        words = WORD_RE.split(text)
+    return {token for token in words if len(token) > 1}.difference(stopwords)
+
+
+def extract_tokens_regex(text: str, stopwords: set[str]) -> set[str]:
+    """
+    Reference implementation of extract_tokens splitting with WORD_RE.
+    """
+    tokens = set()
+    for token in WORD_RE.split(text):
+        if token and len(token) > 1 and token not in stopwords:
+            tokens.add(token)
+    return tokens
@@ -0,0 +1,135 @@
+"""
+Threaded output writers used by main.py to demultiplex the preprocessor output.
+
+Each output gets a QueuedWriter with its own thread and bounded queue. Lines are
+collected into large batches before they are queued, and the thread writes the
+batches to the underlying handle (a local file or the stdin of `hdfs dfs -put`).
+A slow output only blocks the producer once its queue is full, the other
+outputs keep being written meanwhile.
+"""
+
+import queue
+import sys
+import threading
+import time
+
+# Size of the batches handed to the writer thread
+BATCH_BYTES = 1 << 20
+# Number of batches buffered per output before write() blocks
+QUEUE_BATCHES = 16
+# Log progress every time this many bytes have been written
+PROGRESS_BYTES = 256 << 20
+
+
+class QueuedWriter:
+    """
+    File-like writer which writes to handle from a background thread.
+    Closing the writer flushes all queued batches and closes the handle.
+    """
+
+    def __init__(self, name, handle, batch_bytes=BATCH_BYTES, queue_batches=QUEUE_BATCHES):
+        self.name = name
+        self.handle = handle
+        self.batch_bytes = batch_bytes
+        self.queue = queue.Queue(maxsize=queue_batches)
+        self.batch = []
+        self.batch_size = 0
+        self.error = None
+
+        self.lines = 0
+        self.bytes = 0
+        self.blocked_seconds = 0.0
+        self.write_seconds = 0.0
+        # Measured from the first write, not from starting the job
+        self.start = None
+        self.end = None
+
+        self.thread = threading.Thread(target=self._run, name=f"writer-{name}", daemon=True)
+        self.thread.start()
+
+    def write(self, text):
+        if self.start is None:
+            self.start = time.perf_counter()
+        self.batch.append(text)
+        self.batch_size += len(text)
+        self.lines += 1
+        if self.batch_size >= self.batch_bytes:
+            self._flush_batch()
+
+    def _flush_batch(self):
+        if self.error is not None:
+            raise self.error
+        if not self.batch:
+            return
+        chunk = "".join(self.batch)
+        self.batch = []
+        self.batch_size = 0
+        if self.queue.full():
+            start = time.perf_counter()
+            self.queue.put(chunk)
+            self.blocked_seconds += time.perf_counter() - start
+        else:
+            self.queue.put(chunk)
+
+    def _run(self):
+        next_progress = PROGRESS_BYTES
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            if self.error is not None:
+                # Keep draining so the producer never blocks on a failed output
+                continue
+            start = time.perf_counter()
+            try:
+                self.handle.write(chunk)
+            except Exception as e:
+                self.error = e
+                continue
+            self.write_seconds += time.perf_counter() - start
+            self.bytes += len(chunk)
+            if self.bytes >= next_progress:
+                next_progress += PROGRESS_BYTES
+                print(f"[INFO] {self.name}: {self.bytes >> 20} MB written", file=sys.stderr)
+
+    def close(self):
+        """
+        Write the remaining lines, stop the thread and close the handle.
+        """
+        try:
+            self._flush_batch()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            self.end = time.perf_counter()
+            self.handle.close()
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        """
+        Progress and throughput of the writer as a dict.
+        """
+        if self.start is None:
+            seconds = 0.0
+        else:
+            seconds = (self.end or time.perf_counter()) - self.start
+        return {
+            "name": self.name,
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "seconds": seconds,
+            "write_seconds": self.write_seconds,
+            "blocked_seconds": self.blocked_seconds,
+            "mb_per_second": self.bytes / (1 << 20) / seconds if seconds else 0.0,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        print(
+            f"[INFO] {stats['name']}: {stats['lines']} lines, "
+            f"{stats['bytes'] / (1 << 20):.1f} MB in {stats['seconds']:.2f} s "
+            f"({stats['mb_per_second']:.1f} MB/s), "
+            f"writing {stats['write_seconds']:.2f} s, blocked {stats['blocked_seconds']:.2f} s",
+            file=sys.stderr,
+        )
@@ -0,0 +1,88 @@
+"""
+Caching policy of the RDD pipelines: storage level by kind of dataset, a
+registry of what is cached and unpersisting after the last use.
+
+PySpark stores RDD partitions as pickled bytes at every level, so the choice
+is only where they go:
+    input         parsed reviews, large and read a few times: on local disk,
+                  still cheaper than re-reading HDFS and parsing JSON
+    intermediate  counts and scores: in memory, spilled to disk if it is full
+                  instead of dropped and recomputed
+    result        top k lists, small: in memory only
+Datasets which are used by a single action are not cached at all.
+
+The statistics come from the storage info of the SparkContext (through the
+JVM gateway), cached partitions out of all partitions is the share of reads
+served from the cache, the disk size of an in-memory level is spilled data.
+"""
+
+import sys
+
+from pyspark import StorageLevel
+
+LEVELS = {
+    "input": StorageLevel.DISK_ONLY,
+    "intermediate": StorageLevel.MEMORY_AND_DISK,
+    "result": StorageLevel.MEMORY_ONLY,
+}
+
+
+class CacheTracker:
+    """
+    Registry of the persisted RDDs of a SparkContext by name.
+    """
+
+    def __init__(self, sc):
+        self.sc = sc
+        self.datasets = {}
+
+    def persist(self, rdd, name, kind="intermediate"):
+        """
+        Persist an RDD at the level of its kind and return it.
+        A dataset of the same name (e.g. from re-running a cell) is released.
+        """
+        if name in self.datasets:
+            self.release(name)
+        self.datasets[name] = rdd.setName(name).persist(LEVELS[kind])
+        return rdd
+
+    def stats(self):
+        """
+        Storage statistics of the tracked datasets which have been computed.
+        """
+        names = {rdd.id(): name for name, rdd in self.datasets.items()}
+        stats = {}
+        for info in self.sc._jsc.sc().getRDDStorageInfo():
+            name = names.get(info.id())
+            if name is None:
+                continue
+            stats[name] = {
+                "level": info.storageLevel().description(),
+                "cached_partitions": info.numCachedPartitions(),
+                "partitions": info.numPartitions(),
+                "memory_mb": info.memSize() / (1 << 20),
+                "disk_mb": info.diskSize() / (1 << 20),
+            }
+        return stats
+
+    def log_stats(self, names=None):
+        for name, stats in self.stats().items():
+            if names is not None and name not in names:
+                continue
+            print(
+                f"[INFO] {name}: {stats['cached_partitions']}/{stats['partitions']} "
+                f"partitions cached ({stats['level']}), "
+                f"{stats['memory_mb']:.1f} MB in memory, {stats['disk_mb']:.1f} MB on disk",
+                file=sys.stderr,
+            )
+
+    def release(self, *names):
+        """
+        Unpersist datasets after their last use, logging their statistics first.
+        """
+        self.log_stats(names)
+        for name in names:
+            self.datasets.pop(name).unpersist()
+
+    def release_all(self):
+        self.release(*list(self.datasets))
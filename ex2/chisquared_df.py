@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Top terms per category by chi-squared, with Spark SQL expressions only.
+
+Produces the same output as the RDD path of ex2_part1 (output_rdd.txt format),
+but tokenizing, counting, scoring and ranking all run in the JVM, no record is
+passed through Python:
+    split/array_distinct/explode  tokens of every review, once per review
+    groupBy                       category-term, term and category counts
+    broadcast join                category counts joined to the term counts
+    row_number over a window      top k per category
+
+The split pattern is WORD_PATTERN of ex1/tokenizer.py, with (?U) so Java's
+\\s and \\d match Unicode like Python's re. Scores are computed in doubles,
+the Python path computes the numerator with exact integers.
+Example: spark-submit chisquared_df.py hdfs:///user/$USER/reviews_devset.parquet --stopwords stopwords.txt --output output_df.txt
+"""
+
+import argparse
+import os
+import sys
+
+from pyspark.sql import SparkSession
+from pyspark.sql import functions as F
+from pyspark.sql.window import Window
+
+from ingest import load_reviews
+
+# The tokenizer and metrics are shared with assignment 1, only needed on the driver
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ex1"))
+from scoring import DEFAULT_K, chi_squared, contingency  # noqa: E402
+from tokenizer import WORD_PATTERN  # noqa: E402
+
+
+def load_stopwords(path: str) -> set[str]:
+    """
+    Load stopwords from a file efficiently.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def review_terms(reviews, stopwords):
+    """
+    DataFrame (category, term) with every distinct term of every review.
+    Single characters and stopwords are filtered out.
+    """
+    tokens = F.array_distinct(F.split(F.lower(F.col("reviewText")), "(?U)" + WORD_PATTERN))
+    return reviews.select("category", F.explode(tokens).alias("term")).where(
+        (F.length("term") > 1) & ~F.col("term").isin(sorted(stopwords))
+    )
+
+
+def top_terms(reviews, stopwords, k=DEFAULT_K):
+    """
+    DataFrame (category, term, chi2, rank) of the k terms with the highest
+    chi-squared values per category. Ties are ranked by descending term like
+    the MRJob of assignment 1.
+    """
+    cat_term_counts = (
+        review_terms(reviews, stopwords).groupBy("category", "term").agg(F.count("*").alias("A"))
+    )
+    term_counts = cat_term_counts.groupBy("term").agg(F.sum("A").alias("n_t"))
+    cat_counts = reviews.groupBy("category").agg(F.count("*").alias("n_c"))
+    N = cat_counts.agg(F.sum("n_c")).first()[0]
+
+    counts = cat_term_counts.join(term_counts, "term").join(F.broadcast(cat_counts), "category")
+    # Doubles, the squared numerator overflows 64 bit integers
+    N = F.lit(float(N))
+    A, B, C, D = contingency(
+        N, F.col("n_t").cast("double"), F.col("n_c").cast("double"), F.col("A").cast("double")
+    )
+    # Division by zero is null in Spark, the RDD path scores it as 0
+    scored = counts.select(
+        "category", "term", F.coalesce(chi_squared(N, A, B, C, D), F.lit(0.0)).alias("chi2")
+    )
+
+    window = Window.partitionBy("category").orderBy(F.desc("chi2"), F.desc("term"))
+    return scored.withColumn("rank", F.row_number().over(window)).where(F.col("rank") <= k)
+
+
+def output_lines(top):
+    """
+    One "category<TAB>term:chi2 ..." line per category in alphabetical order,
+    followed by the sorted dictionary of all selected terms.
+    """
+    categories = {}
+    for row in top.orderBy("category", "rank").collect():
+        categories.setdefault(row["category"], []).append(f"{row['term']}:{row['chi2']:.4f}")
+
+    lines = [f"{category}\t{' '.join(terms)}" for category, terms in sorted(categories.items())]
+    terms = sorted({pair.rsplit(":", 1)[0] for pairs in categories.values() for pair in pairs})
+    return lines + [" ".join(terms)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chi-squared top terms with Spark SQL")
+    parser.add_argument("input", help="Parquet copy of ingest.py or JSON lines review file")
+    parser.add_argument("--stopwords", default="stopwords.txt", help="Path to the stopwords file")
+    parser.add_argument("--output", default="output_rdd.txt", help="Local output file")
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="Terms per category")
+    args = parser.parse_args()
+
+    spark = SparkSession.builder.appName("DIC EX 2 - group 36").getOrCreate()
+    top = top_terms(load_reviews(spark, args.input), load_stopwords(args.stopwords), args.k)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write("\n".join(output_lines(top)))
+    spark.stop()
+
+
+if __name__ == "__main__":
+    main()
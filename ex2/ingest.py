@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+One-time ingestion of the review corpus into a Parquet copy partitioned by
+category, and the loader all Spark stages read the reviews with.
+
+The JSON is parsed once with an explicit schema (no inference pass over the
+input). Afterwards a stage only reads the columns it selects from Parquet, a
+filter on the category only reads the files of the matching categories.
+The copy records the paths, sizes and modification times of its source files,
+it is written again when ingest is called with another or a changed source.
+Example: spark-submit ingest.py hdfs:///user/dic25_shared/amazon-reviews/full/reviews_devset.json
+"""
+
+import argparse
+import getpass
+import json
+import sys
+
+from pyspark.sql import SparkSession
+from pyspark.sql.types import (
+    ArrayType,
+    DoubleType,
+    LongType,
+    StringType,
+    StructField,
+    StructType,
+)
+
+DEFAULT_OUTPUT = f"hdfs:///user/{getpass.getuser()}/reviews_devset.parquet"
+# Fingerprint of the source in the copy, files starting with _ are not read as data
+SOURCE_MARKER = "_SOURCE"
+# The columns used by the chi-squared jobs and the feature pipelines
+DEFAULT_COLUMNS = ("category", "reviewText")
+
+REVIEW_SCHEMA = StructType(
+    [
+        StructField("reviewerID", StringType()),
+        StructField("asin", StringType()),
+        StructField("reviewerName", StringType()),
+        StructField("helpful", ArrayType(LongType())),
+        StructField("reviewText", StringType()),
+        StructField("overall", DoubleType()),
+        StructField("summary", StringType()),
+        StructField("unixReviewTime", LongType()),
+        StructField("reviewTime", StringType()),
+        StructField("category", StringType()),
+    ]
+)
+
+
+def hadoop_path(spark, path):
+    """
+    Hadoop file system and path object of a path (HDFS or local).
+    """
+    sc = spark.sparkContext
+    path = sc._jvm.org.apache.hadoop.fs.Path(path)
+    return path.getFileSystem(sc._jsc.hadoopConfiguration()), path
+
+
+def exists(spark, path):
+    """
+    Whether a path exists on its Hadoop file system.
+    """
+    fs, path = hadoop_path(spark, path)
+    return fs.exists(path)
+
+
+def source_fingerprint(spark, source):
+    """
+    The source path with the path, size and modification time of every file
+    (or directory) it matches.
+    """
+    fs, path = hadoop_path(spark, source)
+    files = sorted(
+        [str(status.getPath()), status.getLen(), status.getModificationTime()]
+        for status in fs.globStatus(path) or []
+    )
+    return json.dumps({"source": source, "files": files})
+
+
+def read_marker(spark, path):
+    """
+    Content of a marker file, None if it does not exist.
+    """
+    fs, path = hadoop_path(spark, path)
+    if not fs.exists(path):
+        return None
+    stream = fs.open(path)
+    try:
+        return stream.readUTF()
+    finally:
+        stream.close()
+
+
+def write_marker(spark, path, text):
+    fs, path = hadoop_path(spark, path)
+    stream = fs.create(path, True)
+    try:
+        stream.writeUTF(text)
+    finally:
+        stream.close()
+
+
+def ingest(spark, source, target=DEFAULT_OUTPUT, overwrite=False):
+    """
+    Write the Parquet copy of a JSON lines review file, one directory per
+    category. Skipped if a complete copy of the unchanged source exists,
+    returns whether it was written.
+    """
+    fingerprint = source_fingerprint(spark, source)
+    marker = f"{target}/{SOURCE_MARKER}"
+    # _SUCCESS is only written once all partitions are committed
+    if not overwrite and exists(spark, f"{target}/_SUCCESS"):
+        if read_marker(spark, marker) == fingerprint:
+            return False
+        print(f"[INFO] {target} is not a copy of {source}, ingesting it again", file=sys.stderr)
+    # No shuffle by category: a large category would be written by one task,
+    # every input partition writes its own file per category instead
+    (
+        spark.read.schema(REVIEW_SCHEMA)
+        .json(source)
+        .write.mode("overwrite")
+        .partitionBy("category")
+        .parquet(target)
+    )
+    write_marker(spark, marker, fingerprint)
+    return True
+
+
+def load_reviews(spark, path=DEFAULT_OUTPUT, columns=DEFAULT_COLUMNS):
+    """
+    DataFrame of the selected review columns. JSON files (ending in .json) are
+    read with the explicit schema of those columns, anything else as Parquet.
+    """
+    if path.endswith(".json"):
+        schema = StructType([field for field in REVIEW_SCHEMA.fields if field.name in columns])
+        return spark.read.schema(schema).json(path).select(*columns)
+    return spark.read.parquet(path).select(*columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parquet copy of the review corpus")
+    parser.add_argument("input", help="JSON lines review file")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Parquet directory")
+    parser.add_argument("--overwrite", action="store_true", help="Replace an existing copy")
+    args = parser.parse_args()
+
+    spark = SparkSession.builder.appName("DIC EX 2 - group 36").getOrCreate()
+    if ingest(spark, args.input, args.output, args.overwrite):
+        print(f"[INFO] Reviews written to {args.output}")
+    else:
+        print(f"[INFO] {args.output} is a copy of {args.input}, use --overwrite to replace it")
+    spark.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Top k values per key of a pair RDD with bounded heaps.
+
+groupByKey() followed by sorted(...)[:k] shuffles every value of a key and
+sorts them all in one executor. aggregateByKey keeps a min-heap of at most k
+values per key and partition instead, so only partitions x k values per key
+are shuffled and no executor holds more than that for a large key.
+"""
+
+import heapq
+
+
+def _push(heap, item, k):
+    """
+    Add an item to a min-heap which keeps the k largest items.
+    """
+    if len(heap) < k:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+    return heap
+
+
+def top_k_by_key(rdd, k, key=lambda value: value):
+    """
+    RDD of (key, list of the k largest values by key(value), largest first).
+    Values with the same key(value) are ordered by the values themselves.
+    """
+
+    def add(heap, value):
+        return _push(heap, (key(value), value), k)
+
+    def merge(heap, other):
+        for item in other:
+            _push(heap, item, k)
+        return heap
+
+    # The zero value is copied for every key by aggregateByKey
+    return rdd.aggregateByKey([], add, merge).mapValues(
+        lambda heap: [value for _, value in sorted(heap, reverse=True)]
+    )